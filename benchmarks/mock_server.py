@@ -0,0 +1,241 @@
+"""
+Local stand-in for the Oikotie search API and listing detail pages.
+
+Serves generated or recorded cards from `/api/search` and an HTML detail page per card, with configurable
+latency, error rate and rate limiting. The server also accepts absolute-form request targets, so it can be
+used as the proxy in `proxy_url` as well as the target.
+
+Run standalone with `python -m benchmarks.mock_server --cards 5000 --latency 0.05`.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from src.parsers import DETAIL_FIELDS
+
+BUILDING_TYPES = ['1', '256', '2', '64', '4', '8', '32', '128']
+CITIES = [('Helsinki', '00100'), ('Espoo', '02100'), ('Tampere', '33100'), ('Turku', '20100'), ('Oulu', '90100')]
+
+
+def generate_cards(count, base_url, card_type=100, seed=0):
+    """Cards shaped like the search API response, sorted by `published` descending."""
+    rng = random.Random(seed)
+    published = datetime(2024, 6, 1, 12, 0, 0)
+    cards = []
+    for index in range(count):
+        card_id = (30000000 if card_type == 101 else 20000000) + index
+        city, _ = rng.choice(CITIES)
+        size = round(rng.uniform(20, 150), 1)
+        if card_type == 101:
+            price = f"{rng.randint(400, 3000)} € / kk"
+        else:
+            price = f"{rng.randint(50, 900) * 1000:,} €".replace(',', '\xa0')
+        published -= timedelta(minutes=rng.randint(1, 90))
+        cards.append({
+            'cardId': card_id,
+            'cardType': card_type,
+            'cardSubType': [1],
+            'buildingType': rng.choice(BUILDING_TYPES),
+            'status': 1,
+            'url': f"{base_url}/myytavat-asunnot/{city.lower()}/{card_id}",
+            'data': {
+                'roomConfiguration': f"{rng.randint(1, 5)}h+k",
+                'buildYear': rng.randint(1900, 2024),
+                'price': price,
+                'size': f"{size} m²".replace('.', ','),
+                'description': 'Mock listing',
+                'rooms': rng.randint(1, 5),
+                'newDevelopment': rng.random() < 0.1,
+                'visits': rng.randint(0, 5000),
+                'visitsWeekly': rng.randint(0, 500),
+            },
+            'location': {
+                'district': 'Keskusta',
+                'city': city,
+                'country': 'Suomi',
+                'address': f"Mockkatu {index % 200 + 1}",
+                'latitude': 60.0 + rng.random(),
+                'longitude': 24.0 + rng.random(),
+            },
+            'meta': {
+                'published': published.strftime('%Y-%m-%d %H:%M:%S'),
+                'priceChanged': None,
+                'sellStatus': None,
+                'contractType': 1,
+                'listingType': 1,
+            },
+            'medias': [{'imageLargeJPEG': f"{base_url}/images/{card_id}/{n}.jpg"} for n in range(rng.randint(0, 5))],
+            'company': {'companyId': rng.randint(1, max(2, count // 50)), 'companyName': 'Mock LKV',
+                        'logoSmall': None},
+        })
+    return cards
+
+
+def render_detail_page(card):
+    """Listing page with the breadcrumbs and `listing-details` sections that the parser reads."""
+    city = card['location']['city']
+    postal_code = dict(CITIES).get(city, '00100')
+    sections = {}
+    for (section, title), field in DETAIL_FIELDS.items():
+        value = card['data'].get('price') if field == 'sellingPriceText' else f"{field} {card['cardId']}"
+        sections.setdefault(section, []).append(
+            f'<div class="info-table__row"><dt class="info-table__title">{escape(title)}</dt>'
+            f'<dd class="info-table__value">{escape(value)}</dd></div>')
+    body = ''.join(
+        f'<div class="listing-details"><h3 class="listing-details__title">{escape(section)}</h3>'
+        f'<dl class="info-table">{"".join(rows)}</dl></div>'
+        for section, rows in sections.items())
+    filler = '<p>Lorem ipsum dolor sit amet.</p>' * 200  # Real pages are mostly markup the parser skips
+    return (f'<!DOCTYPE html><html><head><title>{card["cardId"]}</title></head><body>'
+            f'<div class="breadcrumbs"><span class="breadcrumbs__item">Asunnot</span>'
+            f'<span class="breadcrumbs__item">{escape(card["location"]["address"])}, {postal_code} {city}</span></div>'
+            f'{filler}<div class="listing-details-container">{body}</div></body></html>')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class MockOikotie:
+    """Threaded HTTP server holding the mock catalogue and the fault injection settings."""
+
+    def __init__(self, cards=None, card_count=1000, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit=None, pages_dir=None, host='127.0.0.1', port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.pages_dir = Path(pages_dir) if pages_dir else None
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0
+        self._updated = time.monotonic()
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.mock = self
+        if cards is None:
+            cards = generate_cards(card_count, self.url, 100, seed) + generate_cards(card_count, self.url, 101, seed + 1)
+        self.cards = cards
+        self.cards_by_id = {str(card['cardId']): card for card in cards}
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def admit(self):
+        """Returns the status code to fail the request with, or None to serve it."""
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    return 429
+                self._tokens -= 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 503
+        return None
+
+    def search(self, query):
+        card_type = int(query.get('cardType', ['100'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['24'])[0])
+        building_types = set(query.get('buildingType[]', []))
+        room_counts = {int(value) for value in query.get('roomCount[]', [])}
+        cards = [card for card in self.cards if card.get('cardType') == card_type
+                 and (not building_types or card.get('buildingType') in building_types)
+                 and (not room_counts or card['data'].get('rooms') in room_counts)]
+        return {'found': len(cards), 'start': offset, 'cards': cards[offset:offset + limit]}
+
+    def detail_page(self, card_id):
+        if self.pages_dir:
+            page = self.pages_dir / f"{card_id}.html"
+            if page.exists():
+                return page.read_text(encoding='utf-8')
+        card = self.cards_by_id.get(card_id)
+        return render_detail_page(card) if card else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        mock = self.server.mock
+        delay = mock.latency + (mock.random.uniform(0, mock.jitter) if mock.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        failure = mock.admit()
+        if failure:
+            return self._send(failure, headers={'Retry-After': '1'} if failure == 429 else None)
+
+        url = urlsplit(self.path)  # Absolute-form when the server is used as the proxy
+        if url.path == '/api/search':
+            if 'ota-token' not in self.headers:
+                return self._send(401)
+            body = json.dumps(mock.search(parse_qs(url.query))).encode('utf-8')
+            return self._send(200, body, 'application/json')
+        page = mock.detail_page(url.path.rstrip('/').rsplit('/', 1)[-1])
+        if page is None:
+            return self._send(404)
+        return self._send(200, page.encode('utf-8'), 'text/html; charset=utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cards', type=int, default=1000, help="Generated cards per card type")
+    parser.add_argument('--cards-file', help="JSON list of recorded search cards to serve instead")
+    parser.add_argument('--pages-dir', help="Directory of recorded <cardId>.html detail pages")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Maximum random seconds added on top")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument('--rate-limit', type=float, help="Requests per second before answering 429")
+    args = parser.parse_args()
+
+    cards = json.loads(Path(args.cards_file).read_text(encoding='utf-8')) if args.cards_file else None
+    server = MockOikotie(cards=cards, card_count=args.cards, latency=args.latency, jitter=args.jitter,
+                         error_rate=args.error_rate, rate_limit=args.rate_limit, pages_dir=args.pages_dir,
+                         host=args.host, port=args.port)
+    print(f"Serving mock Oikotie at {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+End-to-end throughput benchmarks against the local mock Oikotie server.
+
+Scenarios:
+    search    pages through `deal_crawler_generator`
+    details   fetches and parses detail pages with `fetch_card_details`
+    pipeline  runs the whole `main()` actor against local storage
+    resume    kills the actor halfway, resumes it and checks that no record was lost
+
+Reports cards/sec, p50/p95 request latency, CPU time per card and peak RSS, optionally writes them to a
+JSON file and compares them with a previous result:
+
+    python -m benchmarks.run --cards 2000 --latency 0.02 --output bench.json --compare previous.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.mock_server import MockOikotie, generate_cards
+from src import crawlers
+from src.http_client import HttpClientPool
+from src.rate_limiter import RateController
+
+MOCK_HEADERS = {'ota-token': 'mock-token'}
+
+
+class TimedClientPool(HttpClientPool):
+    """Client pool recording the time to response headers of every request."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self._started = {}
+
+    async def _on_request(self, request):
+        self._started[id(request)] = time.perf_counter()
+
+    async def _on_response(self, response):
+        started = self._started.pop(id(response.request), None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+
+    def get(self, proxy_url=None, api_headers=None):
+        client = super().get(proxy_url, api_headers)
+        if self._on_request not in client.event_hooks['request']:
+            client.event_hooks['request'].append(self._on_request)
+            client.event_hooks['response'].append(self._on_response)
+        return client
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port, options):
+    MockOikotie(port=port, **options).serve_forever()
+
+
+def start_mock_server(options):
+    """Run the mock in its own process so its CPU time is not counted against the crawler."""
+    port = _free_port()
+    process = multiprocessing.Process(target=_serve, args=(port, options), daemon=True)
+    process.start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/ping", timeout=1)
+            break
+        except httpx.TransportError:
+            time.sleep(0.05)
+    return process, url
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(share * 100) - 1]
+
+
+async def bench_search(url, args):
+    crawlers.SEARCH_API_URL = f"{url}/api/search"
+    clients = TimedClientPool()
+    rate_controller = RateController(initial_rate=args.rate, max_rate=args.rate)
+    cards = 0
+    async with clients:
+        async for deals, _ in crawlers.deal_crawler_generator(clients, [MOCK_HEADERS], None, args.concurrency,
+                                                              True, rate_controller, None,
+                                                              args.shard_threshold):
+            cards += len(deals)
+    return cards, clients.latencies
+
+
+async def bench_details(url, args):
+    urls = [card['url'] for card in generate_cards(args.cards, url, 100, seed=0)]
+    clients = TimedClientPool()
+    rate_controller = RateController(initial_rate=args.rate, max_rate=args.rate, burst=args.workers)
+    semaphore = asyncio.Semaphore(args.workers)
+
+    async def fetch(card_url):
+        async with semaphore:
+            return await crawlers.fetch_card_details(clients, card_url, None, rate_controller)
+
+    async with clients:
+        results = await asyncio.gather(*[fetch(card_url) for card_url in urls])
+    return sum(1 for result in results if result), clients.latencies
+
+
+def _actor_storage(url, actor_input):
+    """Local storage with the actor input and pre-seeded API headers, and the environment running the actor on
+    it with the mock server as target and proxy."""
+    storage_dir = Path(tempfile.mkdtemp(prefix='oikotie-bench-'))
+    env = {
+        'APIFY_LOCAL_STORAGE_DIR': str(storage_dir),
+        'CRAWLEE_STORAGE_DIR': str(storage_dir),
+        'PROXY_SERVER': url.split('://', 1)[1],
+        'PROXY_USERNAME': 'bench',
+        'PROXY_PASSWORD': 'bench',
+        'OIKOTIE_SEARCH_API_URL': f"{url}/api/search",
+    }
+    stores = storage_dir / 'key_value_stores'
+    (stores / 'default').mkdir(parents=True)
+    (stores / 'oikotie-crawler-state').mkdir(parents=True)
+    (stores / 'default' / 'INPUT.json').write_text(json.dumps(actor_input))
+    (stores / 'oikotie-crawler-state' / 'API_HEADERS.json').write_text(json.dumps([
+        {'headers': MOCK_HEADERS, 'expiresAt': time.time() + 24 * 3600},
+    ]))
+    return storage_dir, env
+
+
+def _pipeline_input(args, **overrides):
+    return {
+        'crawler_mode': args.mode,
+        'num_workers': args.workers,
+        'search_concurrency': args.concurrency,
+        'search_rate': args.rate,
+        'search_max_rate': args.rate,
+        'detail_rate': args.rate,
+        'detail_max_rate': args.rate,
+        'detail_cache': False,
+        'search_shard_threshold': args.shard_threshold,
+        'resume': False,
+        **overrides,
+    }
+
+
+def _stored_ids(storage_dir, stores=('oikotie-deals', 'oikotie-rents')):
+    return {path.stem for store in stores for path in (storage_dir / 'key_value_stores' / store).glob('*.json')
+            if not path.name.endswith('__metadata__.json')}
+
+
+async def bench_pipeline(url, args):
+    """Run `main()` with local storage, pre-seeded API headers and the mock server as target and proxy."""
+    storage_dir, env = _actor_storage(url, _pipeline_input(args))
+    os.environ.update(env)
+
+    from src import main as actor_main
+    crawlers.SEARCH_API_URL = f"{url}/api/search"
+    pools = []
+
+    def timed_pool(*pool_args, **pool_kwargs):
+        pool = TimedClientPool(*pool_args, **pool_kwargs)
+        pools.append(pool)
+        return pool
+
+    actor_main.HttpClientPool = timed_pool
+    try:
+        await actor_main.main()
+    except SystemExit:  # Actor.exit() ends the process when the actor finishes
+        pass
+    cards = len(_stored_ids(storage_dir))
+    shutil.rmtree(storage_dir, ignore_errors=True)
+    return cards, [latency for pool in pools for latency in pool.latencies]
+
+
+async def bench_resume(url, args):
+    """Kill the actor after a checkpoint once half of the cards are stored, resume it and check that no record
+    was lost.
+
+    Records are only written by the checkpoint saved every second, so cards handled while it is being saved
+    are at stake. Use a `--rate` low enough for the crawl to last a few seconds, e.g. `--cards 400 --rate 100`.
+    """
+    expected = args.cards * (2 if args.mode == 'all' else 1)
+    storage_dir, env = _actor_storage(url, _pipeline_input(args, resume=True, change_tracking=True,
+                                                           checkpoint_interval_seconds=1,
+                                                           write_buffer_size=100000,
+                                                           write_buffer_seconds=3600))
+    env = {**os.environ, **env}
+    command = [sys.executable, '-m', 'src']
+    process = await asyncio.create_subprocess_exec(*command, env=env, stdout=asyncio.subprocess.DEVNULL,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    state_dir = storage_dir / 'key_value_stores' / 'oikotie-crawler-state'
+    while process.returncode is None and len(_stored_ids(storage_dir)) < expected // 2:
+        await asyncio.sleep(0.05)
+    saved = {path: path.stat().st_mtime for path in state_dir.glob('CHECKPOINT_*')}
+    while process.returncode is None and \
+            saved == {path: path.stat().st_mtime for path in state_dir.glob('CHECKPOINT_*')}:
+        await asyncio.sleep(0.01)  # Kill right after a checkpoint is saved
+    if process.returncode is not None:
+        print("resume: the first run finished before it could be killed, lower --rate")
+    else:
+        process.kill()
+        await process.wait()
+    for path in storage_dir.rglob('__metadata__.json'):
+        try:
+            json.loads(path.read_text())
+        except ValueError:  # Cut short by the kill, local storage recreates it
+            path.unlink()
+    process = await asyncio.create_subprocess_exec(*command, env=env, stdout=asyncio.subprocess.DEVNULL,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    await process.wait()
+    stored = _stored_ids(storage_dir)
+    tracked = set()
+    for path in state_dir.glob('CARD_STATE_*'):
+        if path.name.endswith('__metadata__.json'):
+            continue
+        tracked |= set(json.loads(gzip.decompress(path.read_bytes()))['cards'])
+    shutil.rmtree(storage_dir, ignore_errors=True)
+    if len(stored) < expected or tracked - stored:
+        raise RuntimeError(f"Lost records after resuming: {expected - len(stored)} of {expected} missing, "
+                           f"{len(tracked - stored)} of them tracked as written")
+    return len(stored), []
+
+
+SCENARIOS = {
+    'search': bench_search,
+    'details': bench_details,
+    'pipeline': bench_pipeline,
+    'resume': bench_resume,
+}
+
+
+def run_scenario(name, url, args):
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    cards, latencies = asyncio.run(SCENARIOS[name](url, args))
+    wall, cpu = time.perf_counter() - wall_started, time.process_time() - cpu_started
+    return {
+        'cards': cards,
+        'seconds': round(wall, 3),
+        'cardsPerSecond': round(cards / wall, 2) if wall else None,
+        'requests': len(latencies),
+        'latencyP50Ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'latencyP95Ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'cpuMsPerCard': round(cpu * 1000 / cards, 3) if cards else None,
+        'peakRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, previous):
+    for name, metrics in results.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        print(f"{name} vs previous:")
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"    {metric:>15}: {old} -> {value} ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=['search', 'details'])
+    parser.add_argument('--cards', type=int, default=1000, help="Cards served per card type")
+    parser.add_argument('--latency', type=float, default=0.02, help="Mock server latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, help="Mock server requests per second before 429")
+    parser.add_argument('--concurrency', type=int, default=4, help="Search pages in flight")
+    parser.add_argument('--shard-threshold', type=int, default=0, help="Search shard size, 0 disables sharding")
+    parser.add_argument('--workers', type=int, default=24, help="Concurrent detail fetches")
+    parser.add_argument('--mode', choices=['deal', 'rent', 'all'], default='deal', help="Pipeline crawler mode")
+    parser.add_argument('--rate', type=float, default=1000.0, help="Crawler requests per second per identity")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Previous results JSON file to compare against")
+    args = parser.parse_args()
+
+    options = {'card_count': args.cards, 'latency': args.latency, 'jitter': args.jitter,
+               'error_rate': args.error_rate, 'rate_limit': args.rate_limit}
+    process, url = start_mock_server(options)
+    try:
+        results = {}
+        for name in args.scenario:
+            results[name] = run_scenario(name, url, args)
+            print(f"{name}: {json.dumps(results[name])}")
+    finally:
+        process.terminate()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == '__main__':
+    main()
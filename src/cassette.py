@@ -0,0 +1,141 @@
+import json
+import os
+import time
+import uuid
+import zlib
+import httpx
+from apify import Actor
+
+
+class CassetteRecorder:
+    """Appends the raw search JSON and detail HTML of every usable response to compressed archive segments.
+
+    A segment is a `<name>.bin` file of zlib-compressed bodies and a `<name>.index.jsonl` file with the URL,
+    status, content type, offset and length of each body. Segments are closed at `segment_bytes` so they fit
+    in a key-value store record, and copied to `store` when closed.
+    """
+
+    def __init__(self, root, store=None, segment_bytes=8*1024*1024):
+        self.root = root
+        self.store = store
+        self.segment_bytes = segment_bytes
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.segment_number = 0
+        self.recorded = 0
+        self._data = None
+        self._index = None
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def segment(self):
+        return f'{self.run_id}-{self.segment_number:05d}'
+
+    def _open_segment(self):
+        self._data = open(os.path.join(self.root, f'{self.segment}.bin'), 'ab')
+        self._index = open(os.path.join(self.root, f'{self.segment}.index.jsonl'), 'a', encoding='utf-8')
+
+    async def _close_segment(self):
+        segment = self.segment
+        self._data.close()
+        self._index.close()
+        self._data = self._index = None
+        self.segment_number += 1
+        if self.store:
+            for suffix in ('bin', 'index.jsonl'):
+                with open(os.path.join(self.root, f'{segment}.{suffix}'), 'rb') as file:
+                    await self.store.set_value(f"{segment}-{suffix.replace('.', '-')}", file.read(),
+                                               content_type='application/octet-stream')
+
+    async def record_response(self, response):
+        """httpx response event hook."""
+        status_code = response.status_code
+        if status_code >= 400 and status_code not in (404, 410):  # Errors and rejected tokens are not replayed
+            return
+        await response.aread()
+        if self._data is None:
+            self._open_segment()
+        body = zlib.compress(response.content)
+        offset = self._data.tell()
+        self._data.write(body)
+        self._data.flush()  # The index must never point past the data on disk
+        self._index.write(json.dumps({
+            'url': str(response.request.url),
+            'status': status_code,
+            'contentType': response.headers.get('Content-Type'),
+            'offset': offset,
+            'length': len(body),
+            'recordedAt': time.time(),
+        }) + '\n')
+        self._index.flush()
+        self.recorded += 1
+        if offset + len(body) >= self.segment_bytes:
+            await self._close_segment()
+
+    async def close(self):
+        if self._data is not None:
+            await self._close_segment()
+        Actor.log.info(f"Recorded {self.recorded} responses to {self.root}")
+
+
+class CassetteReplayer(httpx.AsyncBaseTransport):
+    """httpx transport answering requests from recorded segments, the latest recording of a URL wins.
+
+    URLs that were never recorded are answered with 404.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index = {}
+        self.replayed = 0
+        self.missing = 0
+        self._files = {}
+        for name in sorted(os.listdir(root)):
+            if not name.endswith('.index.jsonl'):
+                continue
+            segment = name[:-len('.index.jsonl')]
+            with open(os.path.join(root, name), encoding='utf-8') as index:
+                for line in index:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:  # Last line of an interrupted recording
+                        continue
+                    self.index[entry['url']] = (segment, entry['offset'], entry['length'], entry['status'],
+                                                entry.get('contentType'))
+        Actor.log.info(f"Replaying {len(self.index)} recorded URLs from {root}")
+
+    @classmethod
+    async def download(cls, store, root):
+        """Copy the segments recorded to `store` into `root`, skipping ones already there."""
+        os.makedirs(root, exist_ok=True)
+        async for key, _ in store.iterate_keys():
+            for suffix in ('bin', 'index.jsonl'):
+                store_suffix = f"-{suffix.replace('.', '-')}"
+                if key.endswith(store_suffix):
+                    path = os.path.join(root, f'{key[:-len(store_suffix)]}.{suffix}')
+                    if not os.path.exists(path):
+                        with open(path, 'wb') as file:
+                            file.write(await store.get_value(key))
+        return cls(root)
+
+    def _read(self, segment, offset, length):
+        data = self._files.get(segment)
+        if data is None:
+            data = self._files[segment] = open(os.path.join(self.root, f'{segment}.bin'), 'rb')
+        data.seek(offset)
+        return zlib.decompress(data.read(length))
+
+    async def handle_async_request(self, request):
+        entry = self.index.get(str(request.url))
+        if entry is None:
+            self.missing += 1
+            return httpx.Response(404, request=request)
+        segment, offset, length, status_code, content_type = entry
+        self.replayed += 1
+        headers = {'Content-Type': content_type} if content_type else {}
+        return httpx.Response(status_code, headers=headers, content=self._read(segment, offset, length),
+                              request=request)
+
+    async def aclose(self):
+        for data in self._files.values():
+            data.close()
+        self._files = {}
@@ -0,0 +1,85 @@
+import gzip
+import json
+from datetime import datetime
+
+from src.dedup import content_hash
+
+CHANGE_FIELDS = ('price', 'status', 'sellStatus')
+SNAPSHOT_IGNORED_FIELDS = ('updatedAt', 'visits', 'visitsWeekly')
+
+
+class ChangeTracker:
+    """Compact state per cardId used to emit change events and skip unchanged snapshot records.
+
+    A card's state is `[content hash, price, status, sellStatus, generation]`. The generation is bumped for
+    every new crawl, so cards not observed by a complete crawl are the ones that were delisted.
+    """
+
+    def __init__(self, cards=None, generation=0, ignore=SNAPSHOT_IGNORED_FIELDS):
+        self.cards = dict(cards or {})
+        self.generation = generation
+        self.ignore = tuple(ignore)
+        self.unchanged = 0
+
+    @classmethod
+    async def load(cls, store, key, new_crawl=True, ignore=SNAPSHOT_IGNORED_FIELDS):
+        value = await store.get_value(key)
+        if not value:
+            return cls(generation=1, ignore=ignore)
+        state = json.loads(gzip.decompress(value))
+        return cls(state['cards'], state['generation'] + (1 if new_crawl else 0), ignore)
+
+    def snapshot(self):
+        """Compressed state as of now, to save in step with a checkpoint copied at the same time."""
+        state = {'generation': self.generation, 'cards': self.cards}
+        return gzip.compress(json.dumps(state, default=str).encode('utf-8'))
+
+    async def save(self, store, key, snapshot=None):
+        await store.set_value(key, snapshot or self.snapshot(), content_type='application/octet-stream')
+
+    @staticmethod
+    def _event(event_type, card_id, url, previous, current):
+        return {
+            'type': event_type,
+            'cardId': card_id,
+            'url': url,
+            'detectedAt': datetime.now(),
+            'previous': dict(zip(CHANGE_FIELDS, previous)) if previous else None,
+            'current': dict(zip(CHANGE_FIELDS, current)) if current else None,
+        }
+
+    def observe(self, card):
+        """Compare a card with its recorded state, returns whether its snapshot changed, the change events it
+        caused and its new state. The state is only `record`ed once the snapshot is written, so a card whose
+        write is lost is not taken as unchanged by the next crawl."""
+        card_id = str(card.get('cardId'))
+        card_hash = content_hash(card, self.ignore)
+        current = [card.get(field) for field in CHANGE_FIELDS]
+        state = self.cards.get(card_id)
+        new_state = [card_hash, *current, self.generation]
+        if state is None:
+            return True, [self._event('new', card_id, card.get('url'), None, current)], new_state
+
+        previous = state[1:1 + len(CHANGE_FIELDS)]
+        events = []
+        if previous[0] != current[0]:
+            events.append(self._event('price_changed', card_id, card.get('url'), previous, current))
+        if previous[1:] != current[1:]:
+            events.append(self._event('status_changed', card_id, card.get('url'), previous, current))
+        changed = state[0] != card_hash
+        if not changed:
+            self.unchanged += 1
+        return changed, events, new_state
+
+    def record(self, card_id, state):
+        self.cards[card_id] = state
+
+    def delisted(self):
+        """Events for cards not observed in this crawl, which are dropped from the state. Only call this after
+        a crawl that covered the whole search."""
+        events = []
+        for card_id, state in list(self.cards.items()):
+            if state[-1] < self.generation:
+                events.append(self._event('delisted', card_id, None, state[1:1 + len(CHANGE_FIELDS)], None))
+                del self.cards[card_id]
+        return events
@@ -0,0 +1,124 @@
+import asyncio
+import copy
+from contextlib import asynccontextmanager
+from apify import Actor
+
+
+class Checkpoint:
+    """Crawl progress that lets a restarted run continue where the previous one died.
+
+    `offset` is the lowest search offset whose batch has not been fully handed to the detail pipeline,
+    `failed_offsets` are offsets that failed after retries and are replayed in a final sweep, and
+    `pending_cards` are cards queued for detail fetching whose records are not written yet.
+    A sharded search keeps `(params, checkpoint)` per shard in `shards`. `skipped_cards` are the ids of cards
+    left over by a run whose detail budget ran out, ranked first when a fresh search finds them again.
+    """
+
+    def __init__(self, offset=0, total_card=None, failed_offsets=(), pending_cards=None, shards=None,
+                 completed=False, skipped_cards=()):
+        self.offset = offset
+        self.total_card = total_card
+        self.failed_offsets = list(failed_offsets)
+        self.pending_cards = dict(pending_cards or {})
+        self.skipped_cards = list(skipped_cards)
+        self.shards = shards
+        self.completed = completed
+
+    @classmethod
+    def from_dict(cls, value):
+        shards = value.get('shards')
+        if shards is not None:
+            shards = [(shard['params'], cls.from_dict(shard)) for shard in shards]
+        return cls(offset=value.get('offset', 0),
+                   total_card=value.get('totalCard'),
+                   failed_offsets=value.get('failedOffsets', []),
+                   pending_cards=value.get('pendingCards', {}),
+                   shards=shards,
+                   completed=value.get('completed', False),
+                   skipped_cards=value.get('skippedCards', []))
+
+    def to_dict(self):
+        value = {
+            'offset': self.offset,
+            'totalCard': self.total_card,
+            'failedOffsets': self.failed_offsets,
+            'pendingCards': self.pending_cards,
+        }
+        if self.skipped_cards:
+            value['skippedCards'] = self.skipped_cards
+        if self.shards is not None:
+            value['shards'] = [{'params': params, **shard.to_dict(), 'completed': shard.completed}
+                               for params, shard in self.shards]
+        return value
+
+    @classmethod
+    async def load(cls, store, key):
+        value = await store.get_value(key)
+        if not value:
+            return cls()
+        checkpoint = cls.from_dict(value)
+        Actor.log.info(f"Resuming from offset {checkpoint.offset} of {checkpoint.total_card} with "
+                       f"{len(checkpoint.failed_offsets)} failed offsets and "
+                       f"{len(checkpoint.pending_cards)} pending cards")
+        if checkpoint.skipped_cards:
+            Actor.log.info(f"{len(checkpoint.skipped_cards)} cards skipped by the detail budget are ranked first")
+        if checkpoint.shards is not None:
+            remaining = sum(1 for _, shard in checkpoint.shards if not shard.completed)
+            Actor.log.info(f"{remaining} of {len(checkpoint.shards)} search shards left to crawl")
+        return checkpoint
+
+    async def save(self, store, key):
+        await store.set_value(key, self.to_dict())
+
+    @property
+    def started(self):
+        """Whether the checkpoint holds the progress of an earlier crawl, cards left over from a finished one
+        alone start a new crawl."""
+        return self.total_card is not None or self.shards is not None
+
+    @property
+    def has_gaps(self):
+        """Whether some search offsets are still missing after the final sweep."""
+        return bool(self.failed_offsets) or any(shard.has_gaps or not shard.completed
+                                                for _, shard in self.shards or ())
+
+    async def clear(self, store, key):
+        await store.set_value(key, None)
+
+    @asynccontextmanager
+    async def autosave(self, store, key, interval=60, writers=(), savers=()):
+        """Save every `interval` seconds. The checkpoint is copied before `writers` are flushed and saved after,
+        so a card dropped from the pending cards while the flush runs is still pending in the saved copy.
+
+        `savers` are functions snapshotting state that has to stay in step with the checkpoint. They are called
+        together with the copy and return an awaitable saving the snapshot once the writers are flushed.
+        """
+        stopping = asyncio.Event()
+
+        async def save_periodically():
+            while True:
+                try:
+                    await asyncio.wait_for(stopping.wait(), interval)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                value = copy.deepcopy(self.to_dict())  # Detail workers update pending cards in place
+                saves = [save() for save in savers]
+                try:
+                    for writer in writers:
+                        await writer.flush()
+                    for save in saves:
+                        await save
+                    await store.set_value(key, value)
+                except Exception as e:
+                    Actor.log.error(f"Failed to save checkpoint: {e}", exc_info=True)
+                finally:
+                    for save in saves:
+                        save.close()  # Not awaited when a flush failed
+
+        task = asyncio.create_task(save_periodically())
+        try:
+            yield self
+        finally:
+            stopping.set()  # Let a save in progress finish, cancelling it could drop a writer's batch
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import uuid
+from datetime import date, datetime
+from apify import Actor
+
+from src.models import CARD_DETAILS_FIELDS, str_to_datetime
+from src.normalize import NORMALIZED_COLUMNS, UnparsedValues, normalize_columns
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Fixed column types of the export, the same for deals and rents so partitions can be read as one table
+LISTING_COLUMNS = (
+    ('cardId', 'int64'), ('url', 'string'), ('updatedAt', 'timestamp'), ('status', 'int64'),
+    ('cardType', 'int64'), ('cardSubType', 'list<int64>'), ('roomConfiguration', 'string'),
+    ('buildYear', 'int64'), ('priceText', 'string'), ('price', 'float64'), ('priceCurrency', 'string'),
+    ('priceCycle', 'string'), ('sizeText', 'string'), ('size', 'float64'), ('sizeUnit', 'string'),
+    ('pricePerSquareMeter', 'float64'), ('revenuePerSquareMeter', 'float64'), ('description', 'string'),
+    ('rooms', 'int64'), ('sizeLot', 'float64'), ('sizeMin', 'float64'), ('sizeMax', 'float64'),
+    ('newDevelopment', 'bool'), ('isOnlineOffer', 'bool'), ('extraVisibility', 'bool'), ('visits', 'int64'),
+    ('visitsWeekly', 'int64'), ('district', 'string'), ('city', 'string'), ('country', 'string'),
+    ('address', 'string'), ('latitude', 'float64'), ('longitude', 'float64'), ('published', 'timestamp'),
+    ('contractType', 'int64'), ('listingType', 'int64'), ('sellStatus', 'int64'), ('priceChanged', 'timestamp'),
+    ('image1', 'string'), ('image2', 'string'), ('image3', 'string'), ('image4', 'string'),
+    ('companyId', 'int64'),
+)
+COLUMNS = LISTING_COLUMNS + tuple((name, 'string') for name in CARD_DETAILS_FIELDS)
+# Stored in the hive-style partition path only, as readers reject a file column of the same name
+PARTITION_COLUMNS = ('cardType',)
+FILE_COLUMNS = tuple(column for column in COLUMNS if column[0] not in PARTITION_COLUMNS)
+
+
+def parquet_available():
+    return pyarrow is not None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_timestamp(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return str_to_datetime(value)
+    except ValueError:
+        return None
+
+
+CONVERTERS = {
+    'int64': _to_int,
+    'float64': _to_float,
+    'bool': lambda value: bool(value) if value is not None else None,
+    'string': lambda value: str(value) if value is not None else None,
+    'timestamp': _to_timestamp,
+    'list<int64>': lambda value: [_to_int(item) for item in value] if isinstance(value, list) else None,
+}
+
+
+def arrow_schema():
+    types = {
+        'int64': pyarrow.int64(),
+        'float64': pyarrow.float64(),
+        'bool': pyarrow.bool_(),
+        'string': pyarrow.string(),
+        'timestamp': pyarrow.timestamp('us'),
+        'list<int64>': pyarrow.list_(pyarrow.int64()),
+    }
+    return pyarrow.schema([(name, types[column_type]) for name, column_type in FILE_COLUMNS + NORMALIZED_COLUMNS])
+
+
+class ParquetSink:
+    """Streams records into Parquet files partitioned by `cardType` and crawl date.
+
+    Rows are buffered per partition as columns and written as one row group every `row_group_size` rows,
+    so memory stays bounded by the number of open partitions. The money texts of `CardDetails` are normalised
+    per row group into amount, currency and period columns. Each partition gets one file per run,
+    `<root>/cardType=<type>/crawlDate=<date>/part-<run>.parquet`, copied to `store` when it is closed.
+    """
+
+    def __init__(self, root, row_group_size=10000, store=None, crawl_date=None):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.store = store
+        self.crawl_date = (crawl_date or date.today()).isoformat()
+        self.part = uuid.uuid4().hex[:12]
+        self.schema = arrow_schema()
+        self.buffers = {}
+        self.writers = {}
+        self.rows = 0
+        self.unparsed = UnparsedValues()
+        self._lock = asyncio.Lock()
+
+    def _path(self, card_type):
+        return os.path.join(self.root, f'cardType={card_type}', f'crawlDate={self.crawl_date}',
+                            f'part-{self.part}.parquet')
+
+    async def write(self, key, record):
+        card_type = record.get('cardType')
+        buffer = self.buffers.get(card_type)
+        if buffer is None:
+            buffer = self.buffers[card_type] = {name: [] for name, _ in FILE_COLUMNS}
+        for name, column_type in FILE_COLUMNS:
+            buffer[name].append(CONVERTERS[column_type](record.get(name)))
+        if len(buffer['cardId']) >= self.row_group_size:
+            await self._write_row_group(card_type)
+
+    def _write_table(self, card_type, columns):
+        writer = self.writers.get(card_type)
+        if writer is None:
+            path = self._path(card_type)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self.writers[card_type] = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+        columns.update(normalize_columns(columns, unparsed=self.unparsed))
+        table = pyarrow.Table.from_pydict(columns, schema=self.schema)
+        writer.write_table(table, row_group_size=self.row_group_size)
+
+    async def _write_row_group(self, card_type):
+        columns = self.buffers.pop(card_type, None)
+        if not columns or not columns['cardId']:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._write_table, card_type, columns)
+        self.rows += len(columns['cardId'])
+
+    async def flush(self):
+        for card_type in list(self.buffers):
+            await self._write_row_group(card_type)
+
+    async def close(self):
+        await self.flush()
+        async with self._lock:
+            for card_type, writer in self.writers.items():
+                await asyncio.to_thread(writer.close)
+                if self.store:
+                    with open(self._path(card_type), 'rb') as file:
+                        key = f'cardType-{card_type}_crawlDate-{self.crawl_date}_part-{self.part}'
+                        await self.store.set_value(key, file.read(), content_type='application/octet-stream')
+            self.writers = {}
+        self.unparsed.log()
+        Actor.log.info(f"Exported {self.rows} rows to Parquet under {self.root}")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,24 +1,42 @@
 from apify import Actor
 import asyncio
 import httpx
-import random
-import re
-from bs4 import BeautifulSoup
+import os
+import time
+from contextlib import aclosing
 from src.models import Deal, Rent, Company, CardDetails
+from src.parsers import parse_card_details_async
+from src.checkpoint import Checkpoint
+from src.proxy_pool import headers_usable, record_proxy, resolve_proxy
+from src.rate_limiter import RateController, backoff_delay, rate_identity
+from src.stats import run_stats
 
 
-SLEEP_TIME = 3
+SEARCH_API_URL = os.getenv('OIKOTIE_SEARCH_API_URL', 'https://asunnot.oikotie.fi/api/search')
+SLEEP_TIME = 3  # Initial seconds between search requests per header set
+PAGE_SIZE = 24
 
-async def request_get_oikotie(params, api_headers, proxy_url=None):
-    timeout = httpx.Timeout(30.0, connect=5.0)
-    proxies = {
-        'http://': proxy_url,
-        'https://': proxy_url
-    } if proxy_url else None
-    client = httpx.AsyncClient(timeout=timeout, proxies=proxies)
+
+class TokenRejectedError(Exception):
+    """The search API rejected the `ota-token` with 401 or 403."""
+
+
+async def request_get_oikotie(clients, params, api_headers, proxy=None, rate_controller=None):
+    proxy_url = resolve_proxy(proxy, api_headers)
+    client = clients.get(proxy_url, api_headers)
+    identity = rate_identity(proxy_url, api_headers)
+    if rate_controller:
+        with run_stats.timer('rate_wait'):
+            await rate_controller.acquire(identity)
+    started = time.monotonic()
+    status_code, retry_after, num_bytes = None, None, 0
+    cancelled = False
     try:
-        response = await client.get('https://asunnot.oikotie.fi/api/search', params=params, 
-                                    headers=api_headers)
+        with run_stats.timer('search_request'):
+            response = await client.get(SEARCH_API_URL, params=params,
+                                        timeout=httpx.Timeout(30.0, connect=5.0))
+        status_code, retry_after = response.status_code, response.headers.get('Retry-After')
+        num_bytes = len(response.content)
         response.raise_for_status()
         data = response.json()
 
@@ -31,247 +49,344 @@ async def request_get_oikotie(params, api_headers, proxy_url=None):
             total_card = 23456
             Actor.log.error("Total card is not an int: %s", total_card)
 
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
     except httpx.RequestError as e:
         Actor.log.error("An error occurred while requesting %s; Error: %s", e.request.url, e)
-        cards, total_card = [], 0
+        cards, total_card = [], None
     except httpx.HTTPStatusError as e:
+        if e.response.status_code in (401, 403):
+            raise TokenRejectedError(f"Token rejected with status {e.response.status_code}") from e
         Actor.log.error("Error response %s while requesting %s; Error: %s", e.response.status_code, e.request.url, e)
-        cards, total_card = [], 0
+        cards, total_card = [], None
     except Exception as e:
         Actor.log.error("An unexpected error occurred: %s", e)
-        cards, total_card = [], 0
+        cards, total_card = [], None
     finally:
-        await client.aclose()
+        if not cancelled:  # A search closed early, e.g. at the watermark, says nothing about the server
+            run_stats.record_response('search', identity, status_code, num_bytes)
+            record_proxy(proxy, proxy_url, time.monotonic() - started, status_code)
+            if rate_controller:
+                rate_controller.record(identity, time.monotonic() - started, status_code, retry_after)
     return cards, total_card
 
 
-async def fetch_cards_with_retries(deal_params, api_headers, offset, 
-                                   max_retries=5, proxy_url=None):
+async def fetch_cards_with_retries(clients, deal_params, api_headers, offset,
+                                   max_retries=5, proxy=None, header_pool=None, rate_controller=None):
     retries = 0
     while retries < max_retries:
         try:
-            cards, total_card = await request_get_oikotie({**deal_params, 'offset': offset}, 
-                                                          api_headers, proxy_url)
+            cards, total_card = await request_get_oikotie(clients, {**deal_params, 'offset': offset},
+                                                          api_headers, proxy, rate_controller)
             if cards:
                 return cards, total_card
+        except TokenRejectedError as e:
+            Actor.log.warning(f"{e} at offset {offset}, retrying {retries + 1} times")
+            if hasattr(header_pool, 'refresh'):
+                api_headers = await header_pool.refresh(api_headers)
         except Exception as e:
             Actor.log.error(f"Error at offset {offset}: {e}, retrying {retries + 1} times")
+        run_stats.increment('search_retries',
+                            identity=rate_identity(resolve_proxy(proxy, api_headers), api_headers))
+        await asyncio.sleep(backoff_delay(retries, base=2.0))  # Wait before retrying to avoid hammering the server
         retries += 1
-        await asyncio.sleep(5)  # Wait before retrying to avoid hammering the server
     Actor.log.error(f"Failed to fetch data after {max_retries} retries at offset {offset}")
     return None, 0  # Indicate failure to fetch cards
 
 
 def extract_deal_cards(cards):
-    all_deals = [Deal(card).__dict__ for card in cards if card.get('cardId')]
-    all_company = [Company(card).__dict__ for card in cards]
+    all_deals = [Deal(card).to_dict() for card in cards if card.get('cardId')]
+    all_company = [Company(card).to_dict() for card in cards]
     all_company = [company for company in all_company if company.get('companyId')]
     return all_deals, all_company
 
 
 def extract_rent_cards(cards):
-    all_rents = [Rent(card).__dict__ for card in cards if card.get('cardId')]
-    all_company = [Company(card).__dict__ for card in cards]
+    all_rents = [Rent(card).to_dict() for card in cards if card.get('cardId')]
+    all_company = [Company(card).to_dict() for card in cards]
     all_company = [company for company in all_company if company.get('companyId')]
     return all_rents, all_company
 
 
-async def fetch_card_details(url, proxy_url=None) -> CardDetails:
-    result = {}
-    proxies = {
-        'http://': proxy_url,
-        'https://': proxy_url
-    } if proxy_url else None
-
-    async with httpx.AsyncClient(proxies=proxies) as client:
-        try:
+async def fetch_card_details(clients, url, proxy=None, rate_controller=None) -> CardDetails:
+    proxy_url = resolve_proxy(proxy)
+    client = clients.get(proxy_url)
+    identity = rate_identity(proxy_url)
+    if rate_controller:
+        with run_stats.timer('rate_wait'):
+            await rate_controller.acquire(identity)
+    started = time.monotonic()
+    try:
+        with run_stats.timer('detail_request'):
             response = await client.get(url, timeout=30)
-        except Exception as e:
-            Actor.log.error(f"Error at url {url}: {e}")
-            return result
-
-        if response.status_code not in (404, 410, 200):
-            Actor.log.error(f"Error at url {url}: {response.status_code}")
-            return result
-    
-    soup = BeautifulSoup(response.text, 'html.parser')
-    breadcrumbs = soup.find('div', {'class': 'breadcrumbs'})
-    if breadcrumbs:
-        try:
-            full_address = breadcrumbs.find_all('span', {'class': 'breadcrumbs__item'})[-1].text.strip()
-            postal_code = full_address.split(',')[-1].strip()
-            postal_code = re.search(r'\d+', postal_code).group()
-        except Exception as e:
-            full_address = -1
-            Actor.log.error(f"Error at url {url}: {e}")
-        result['fullAddress'] = full_address
-        result['postalCode'] = postal_code
-
-    listing_details_container = soup.find('div', {'class': 'listing-details-container'})
-
-    def clean_value_text(value):
-        return value.replace('\xa0', ' ').strip() if value else None
-
-    all_listing_details_divs = listing_details_container.find_all('div', {'class': 'listing-details'}) if listing_details_container else []
-    for listing_details_div in all_listing_details_divs:
-        listing_details_title = listing_details_div.find('h3', {'class': 'listing-details__title'})
-        basic_details = listing_details_div.find_all('div', {'class': 'info-table__row'})
-        if not listing_details_title or not basic_details:
-            continue
-        listing_details_title = listing_details_title.text.strip()
-        if listing_details_title == 'Perustiedot': # Basic details
-            for row in basic_details:
-                title = row.find('dt', {'class': 'info-table__title'})
-                value = row.find('dd', {'class': 'info-table__value'})
-                if not title or not value:
-                    continue
-                title = title.text.strip()
-                value = clean_value_text(value.text)
-                if title == 'Tulevat remontit':
-                    result['upcomingRenovations'] = value
-                elif title == 'Tehdyt remontit':
-                    result['doneRenovations'] = value
-                elif title == 'Kunto':
-                    result['conditionType'] = value
-                elif title == 'Asumistyyppi':
-                    result['housingType'] = value
-        elif listing_details_title == 'Talon ja tontin tiedot': # Lot and house
-            for row in basic_details:
-                title = row.find('dt', {'class': 'info-table__title'})
-                value = row.find('dd', {'class': 'info-table__value'})
-                if not title or not value:
-                    continue
-                title = title.text.strip()
-                value = clean_value_text(value.text)
-                if title == 'Tontin omistus':
-                    result['landOwnership'] = value
-        elif listing_details_title == 'Hinta': # Price
-            for row in basic_details:
-                title = row.find('dt', {'class': 'info-table__title'})
-                value = row.find('dd', {'class': 'info-table__value'})
-                if not title or not value:
-                    continue
-                title = title.text.strip()
-                value = clean_value_text(value.text)
-                if title == 'Velaton hinta':
-                    result['debtFreePriceText'] = value
-                elif title == 'Myyntihinta':
-                    result['sellingPriceText'] = value
-                elif title == 'Neliöhinta':
-                    result['pricePerSquareMeterText'] = value
-                elif title == 'Velkaosuus':
-                    result['debtShareText'] = value
-        elif listing_details_title == 'Vastikkeet': # Considersation
-            for row in basic_details:
-                title = row.find('dt', {'class': 'info-table__title'})
-                value = row.find('dd', {'class': 'info-table__value'})
-                if not title or not value:
+    except Exception as e:
+        Actor.log.error(f"Error at url {url}: {e}")
+        run_stats.record_response('detail', identity)
+        record_proxy(proxy, proxy_url, time.monotonic() - started)
+        if rate_controller:
+            rate_controller.record(identity, time.monotonic() - started)
+        return None
+    run_stats.record_response('detail', identity, response.status_code, len(response.content))
+    record_proxy(proxy, proxy_url, time.monotonic() - started, response.status_code)
+    if rate_controller:
+        rate_controller.record(identity, time.monotonic() - started, response.status_code,
+                               response.headers.get('Retry-After'))
+
+    if response.status_code not in (404, 410, 200):
+        Actor.log.error(f"Error at url {url}: {response.status_code}")
+        return None
+
+    with run_stats.timer('parse'):
+        details = await parse_card_details_async(response.text, url)
+    with run_stats.timer('model_build'):
+        return CardDetails(details)
+
+
+def pick_headers(headers_list, index, proxy=None):
+    """Header set `index` of the rotation, skipping sets pinned to a degraded proxy unless all of them are."""
+    for step in range(len(headers_list)):
+        api_headers = headers_list[(index + step) % len(headers_list)]
+        if headers_usable(proxy, api_headers):
+            return api_headers
+    return headers_list[index % len(headers_list)]
+
+
+async def crawl_search_pages(clients, params, headers_list, extract_cards, label,
+                             proxy=None, concurrency=4, ordered=True, rate_controller=None,
+                             checkpoint=None):
+    """Page through a search with up to `concurrency` requests in flight, spread across `headers_list`.
+
+    The first page is fetched alone to learn the `found` total. Batches are yielded in offset order,
+    or in completion order when `ordered` is False. Requests are paced per header set by `rate_controller`.
+    `proxy` is a proxy URL or a `ProxyPool`, which is resolved to a URL for every request.
+    Progress is kept in `checkpoint`: paging starts from its offset, and offsets that fail after retries
+    are replayed in a final sweep.
+    """
+    concurrency = max(1, concurrency)
+    rate_controller = rate_controller or RateController(initial_rate=1/SLEEP_TIME)
+    checkpoint = checkpoint or Checkpoint()
+    total_card = checkpoint.total_card or 1
+    next_offset = checkpoint.offset
+    yield_offset = checkpoint.offset
+    header_index = 0
+    continuous_failures = 0
+    pending = {}
+    finished = {}
+
+    def fetch(offset):
+        nonlocal header_index
+        api_headers = pick_headers(headers_list, header_index, proxy)
+        header_index += 1
+        return fetch_cards_with_retries(clients, params, api_headers, offset, proxy=proxy,
+                                        header_pool=headers_list, rate_controller=rate_controller)
+
+    try:
+        while True:
+            while next_offset < total_card or pending:
+                window = 1 if total_card == 1 else concurrency
+                while next_offset < total_card and len(pending) < window:
+                    pending[asyncio.create_task(fetch(next_offset))] = next_offset
+                    next_offset += PAGE_SIZE
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    finished[pending.pop(task)] = task.result()
+
+                if ordered:
+                    ready = []
+                    while yield_offset in finished:
+                        ready.append(yield_offset)
+                        yield_offset += PAGE_SIZE
+                else:
+                    ready = sorted(finished)
+
+                for offset in ready:
+                    cards, actual_total_card = finished.pop(offset)
+                    if not cards:
+                        checkpoint.failed_offsets.append(offset)
+                        continuous_failures += 1
+                        if continuous_failures > 5:
+                            Actor.log.error(f"Failed to fetch cards at offset {offset} {label}, stopping")
+                            return
+                        continue
+                    continuous_failures = 0
+
+                    if total_card == 1:  # Only update log the first time
+                        Actor.log.info(f"Starting fetch with {actual_total_card} total cards found.")
+
+                    total_card = checkpoint.total_card = actual_total_card  # Update the total count based on fetched data
+                    with run_stats.timer('model_build'):
+                        items, companies = extract_cards(cards)
+
+                    Actor.log.info(f"Fetched cards at offset {offset}, got {len(items)} {label} and {len(companies)} companies.")
+                    yield items, companies
+                    checkpoint.offset = min([next_offset, *pending.values(), *finished])
+
+            for offset in list(checkpoint.failed_offsets):
+                if offset >= total_card:
+                    checkpoint.failed_offsets.remove(offset)
                     continue
-                title = title.text.strip()
-                value = clean_value_text(value.text)
-                if title == 'Hoitovastike':
-                    result['treatmentFeeText'] = value
-                elif title == 'Pääomavastike':
-                    result['capitalConsidersationText'] = value
-                elif title == 'Yhtiövastike yhteensä':
-                    result['totalCompanyConsidersationText'] = value
-        elif listing_details_title == 'Muut maksut': # Other payments
-            for row in basic_details:
-                title = row.find('dt', {'class': 'info-table__title'})
-                value = row.find('dd', {'class': 'info-table__value'})
-                if not title or not value:
+                cards, actual_total_card = await fetch(offset)
+                if not cards:
+                    Actor.log.error(f"Failed to fetch cards at offset {offset} {label} in the final sweep")
                     continue
-                title = title.text.strip()
-                value = clean_value_text(value.text)
-                if title == 'Vesimaksu':
-                    result['waterFeeText'] = value
-                elif title == 'Saunan kustannukset':
-                    result['saunaCostsText'] = value
-                elif title == 'Vesimaksun lisätiedot':
-                    result['waterCostsAdditionalText'] = value
-                elif title == 'Muut kustannukset':
-                    result['otherCostsText'] = value
-
-    return CardDetails(result)
-
-
-async def deal_crawler_generator(headers_list, proxy_url=None):
-    deal_params = {
-        'cardType': '100',
-        'buildingType[]': ['1', '256', '2', '64', '4', '8', '32', '128'],
-        'lotOwnershipType[]': '1', # land ownership
-        'habitationType[]': '1', # housing type
-        'roomCount[]': ['1', '2', '3', '4', '5', '6', '7'],
-        'limit': '24',
-        'offset': '0',
-        'sortBy': 'published_sort_desc',
-    }
-    # For now, not filtering by condition, extracted from the card html data
-    # condition_type = {'64': "All", '2': "Good", '4': "Satisfying", '8': "Passable", '32': "New"}
-    # for condition, description in condition_type.items():
-    # if condition != '64':
-    #     deal_params['conditionType[]'] = condition
-    total_card = 1
-    offset = 0
-    continuous_failures = 0
-    while offset < total_card:
-        api_headers = random.choice(headers_list)
-        cards, actual_total_card = await fetch_cards_with_retries(deal_params, api_headers, offset, 
-                                                                    proxy_url=proxy_url)
-        if not cards:
-            continuous_failures += 1
-            if continuous_failures > 5:
-                Actor.log.error(f"Failed to fetch cards at offset {offset} deal, stopping")
-                return
-            offset += 24
-            continue
-        continuous_failures = 0
-
-        if total_card == 1:  # Only update log the first time
-            Actor.log.info(f"Starting fetch with {actual_total_card} total cards found.")
-        
-        total_card = actual_total_card  # Update the total count based on fetched data
-        deals, companies = extract_deal_cards(cards)
-        
-        Actor.log.info(f"Fetched cards at offset {offset}, got {len(deals)} deals and {len(companies)} companies.")
-        offset += 24
+                if checkpoint.total_card is None:  # The first page failed during paging
+                    total_card = checkpoint.total_card = actual_total_card
+                with run_stats.timer('model_build'):
+                    items, companies = extract_cards(cards)
+                Actor.log.info(f"Fetched cards at failed offset {offset}, got {len(items)} {label} and {len(companies)} companies.")
+                yield items, companies
+                checkpoint.failed_offsets.remove(offset)
+            if next_offset >= total_card:
+                break
+            Actor.log.info(f"Found {total_card} {label} cards in the final sweep, paging from offset {next_offset}")
+        # A search is only complete when its total is known from a response and every page was fetched
+        checkpoint.completed = checkpoint.total_card is not None and not checkpoint.failed_offsets
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def split_params(params):
+    """Split a search into disjoint shards along its first multi-valued list parameter, None if it cannot be split."""
+    for name, values in params.items():
+        if isinstance(values, list) and len(values) > 1:
+            return [{**params, name: [value]} for value in values]
+    return None
+
+
+async def plan_shards(clients, params, headers_list, threshold, proxy=None, rate_controller=None):
+    """Probe the `found` count of a search and split it until every shard has at most `threshold` cards.
+
+    Shards that find nothing are dropped, shards whose count could not be read are kept unsplit.
+    """
+    shards, pending = [], [params]
+    while pending:
+        async def count(shard_params, index):
+            api_headers = pick_headers(headers_list, index, proxy)
+            try:
+                _, found = await request_get_oikotie(clients, {**shard_params, 'limit': '1', 'offset': '0'},
+                                                     api_headers, proxy, rate_controller)
+            except TokenRejectedError:
+                return None
+            return found
+
+        counts = await asyncio.gather(*[count(shard_params, index) for index, shard_params in enumerate(pending)])
+        next_pending = []
+        for shard_params, found in zip(pending, counts):
+            children = split_params(shard_params) if found and found > threshold else None
+            if children:
+                next_pending += children
+            elif found != 0:
+                shards.append(shard_params)
+        pending = next_pending
+    return shards
+
+
+async def crawl_shards(clients, params, headers_list, extract_cards, label,
+                       proxy=None, concurrency=4, ordered=True, rate_controller=None,
+                       checkpoint=None, shard_threshold=2400):
+    """Crawl a search as disjoint shards of at most `shard_threshold` cards, each with its own offset cursor.
+
+    Up to `concurrency` shards are crawled in parallel and their batches are merged, dropping cards already
+    yielded by another shard. The shard plan and the cursor of every shard are kept in `checkpoint.shards`.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    if checkpoint.shards is None:
+        shards = await plan_shards(clients, params, headers_list, shard_threshold, proxy, rate_controller)
+        checkpoint.shards = [(shard_params, Checkpoint()) for shard_params in shards]
+        Actor.log.info(f"Split the {label} search into {len(shards)} shards")
+    remaining = [shard for shard in checkpoint.shards if not shard[1].completed]
+    running = max(1, min(concurrency, len(remaining)))
+    page_concurrency = max(1, concurrency // running)
+    semaphore = asyncio.Semaphore(running)
+    batches = asyncio.Queue()
+    seen = set()
+
+    async def crawl_shard(shard_params, shard_checkpoint):
+        async with semaphore:
+            shard_batches = crawl_search_pages(clients, shard_params, headers_list, extract_cards, label,
+                                               proxy, page_concurrency, ordered, rate_controller,
+                                               shard_checkpoint)
+            async with aclosing(shard_batches):
+                async for items, companies in shard_batches:
+                    handled = asyncio.Event()
+                    await batches.put((items, companies, handled))
+                    await handled.wait()  # The shard cursor only moves once the batch is taken over
 
+    async def crawl_all():
+        results = await asyncio.gather(*[crawl_shard(*shard) for shard in remaining], return_exceptions=True)
+        for (shard_params, _), result in zip(remaining, results):
+            if isinstance(result, Exception):
+                Actor.log.error(f"Failed to crawl {label} shard {shard_params}: {result}")
+        await batches.put(None)
+
+    task = asyncio.create_task(crawl_all())
+    try:
+        while (batch := await batches.get()) is not None:
+            items, companies, handled = batch
+            items = [item for item in items if item.get('cardId') not in seen]
+            seen.update(item.get('cardId') for item in items)
+            yield items, companies
+            handled.set()
+        checkpoint.completed = all(shard_checkpoint.completed for _, shard_checkpoint in checkpoint.shards)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def crawl_search(clients, params, headers_list, extract_cards, label, proxy=None, concurrency=4,
+                 ordered=True, rate_controller=None, checkpoint=None, shard_threshold=None):
+    """Sharded crawl when `shard_threshold` is set, otherwise one linear crawl of the whole search."""
+    if shard_threshold:
+        return crawl_shards(clients, params, headers_list, extract_cards, label, proxy, concurrency,
+                            ordered, rate_controller, checkpoint, shard_threshold)
+    return crawl_search_pages(clients, params, headers_list, extract_cards, label, proxy, concurrency,
+                              ordered, rate_controller, checkpoint)
+
+
+DEAL_PARAMS = {
+    'cardType': '100',
+    'buildingType[]': ['1', '256', '2', '64', '4', '8', '32', '128'],
+    'lotOwnershipType[]': '1', # land ownership
+    'habitationType[]': '1', # housing type
+    'roomCount[]': ['1', '2', '3', '4', '5', '6', '7'],
+    'limit': '24',
+    'offset': '0',
+    'sortBy': 'published_sort_desc',
+}
+# For now, not filtering by condition, extracted from the card html data
+# condition_type = {'64': "All", '2': "Good", '4': "Satisfying", '8': "Passable", '32': "New"}
+# for condition, description in condition_type.items():
+# if condition != '64':
+#     DEAL_PARAMS['conditionType[]'] = condition
+
+RENT_PARAMS = {
+    'cardType': '101',
+    'limit': '24',
+    'offset': '0',
+    'sortBy': 'published_sort_desc',
+}
+
+# Search parameters, card extractor and log label by crawler mode
+SEARCHES = {
+    'deal': (DEAL_PARAMS, extract_deal_cards, 'deals'),
+    'rent': (RENT_PARAMS, extract_rent_cards, 'rents'),
+}
+
+
+async def deal_crawler_generator(clients, headers_list, proxy=None, concurrency=4, ordered=True,
+                                 rate_controller=None, checkpoint=None, shard_threshold=None):
+    async for deals, companies in crawl_search(clients, DEAL_PARAMS, headers_list, extract_deal_cards,
+                                               'deals', proxy, concurrency, ordered,
+                                               rate_controller, checkpoint, shard_threshold):
         yield deals, companies
-        await asyncio.sleep(SLEEP_TIME/len(headers_list))
-
-
-async def rent_crawler_generator(headers_list, proxy_url=None):
-    rent_params = {
-        'cardType': '101',
-        'limit': '24',
-        'offset': '0',
-        'sortBy': 'published_sort_desc',
-    }
-        
-    total_card = 1
-    offset = 0
-    continuous_failures = 0
-    while offset < total_card:
-        api_headers = random.choice(headers_list)
-        cards, actual_total_card = await fetch_cards_with_retries(rent_params, api_headers, offset, 
-                                                                    proxy_url=proxy_url)
-        if not cards:
-            continuous_failures += 1
-            if continuous_failures > 5:
-                Actor.log.error(f"Failed to fetch cards at offset {offset} rents, stopping")
-                return
-            offset += 24
-            continue
-        continuous_failures = 0
-
-        if total_card == 1:  # Only update log the first time
-            Actor.log.info(f"Starting fetch with {actual_total_card} total cards found.")
-        
-        total_card = actual_total_card  # Update the total count based on fetched data
-        reants, companies = extract_rent_cards(cards)
-        
-        Actor.log.info(f"Fetched cards at offset {offset}, got {len(reants)} rents and {len(companies)} companies.")
-        offset += 24
-
-        yield reants, companies
-        await asyncio.sleep(SLEEP_TIME/len(headers_list))
+
+
+async def rent_crawler_generator(clients, headers_list, proxy=None, concurrency=4, ordered=True,
+                                 rate_controller=None, checkpoint=None, shard_threshold=None):
+    async for rents, companies in crawl_search(clients, RENT_PARAMS, headers_list, extract_rent_cards,
+                                               'rents', proxy, concurrency, ordered,
+                                               rate_controller, checkpoint, shard_threshold):
+        yield rents, companies
@@ -0,0 +1,31 @@
+import hashlib
+import json
+
+
+def content_hash(record, ignore=('updatedAt',)):
+    content = {key: value for key, value in record.items() if key not in ignore}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class CompanyIndex:
+    """Content hash by companyId of every company already written, so unchanged companies are skipped."""
+
+    def __init__(self, hashes=None):
+        self.hashes = dict(hashes or {})
+        self.skipped = 0
+
+    @classmethod
+    async def load(cls, store, key):
+        return cls(await store.get_value(key))
+
+    async def save(self, store, key):
+        await store.set_value(key, self.hashes)
+
+    def is_new_or_changed(self, company):
+        company_id = str(company.get('companyId'))
+        company_hash = content_hash(company)
+        if self.hashes.get(company_id) == company_hash:
+            self.skipped += 1
+            return False
+        self.hashes[company_id] = company_hash
+        return True
@@ -0,0 +1,57 @@
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+
+FINGERPRINT_FIELDS = ('priceChanged', 'published', 'status')
+
+
+def card_fingerprint(card):
+    values = [str(card.get(field)) for field in FINGERPRINT_FIELDS]
+    return hashlib.sha1('|'.join(values).encode('utf-8')).hexdigest()[:16]
+
+
+class DetailCache:
+    """Parsed `CardDetails` by cardId, reused while the search card fingerprint is unchanged and the entry is fresh.
+
+    Entries are kept in least recently used order and the oldest ones are evicted above `max_entries`.
+    """
+
+    def __init__(self, entries=None, ttl=3*24*3600, max_entries=50000):
+        self.entries = OrderedDict(entries or {})
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    async def load(cls, store, key, ttl=3*24*3600, max_entries=50000):
+        value = await store.get_value(key)
+        entries = json.loads(gzip.decompress(value)) if value else []
+        return cls(entries=((card_id, entry) for card_id, entry in entries), ttl=ttl, max_entries=max_entries)
+
+    async def save(self, store, key):
+        value = gzip.compress(json.dumps(list(self.entries.items()), default=str).encode('utf-8'))
+        await store.set_value(key, value, content_type='application/octet-stream')
+
+    def get(self, card):
+        card_id = str(card.get('cardId'))
+        entry = self.entries.get(card_id)
+        if entry:
+            fingerprint, fetched_at, details = entry
+            if fingerprint == card_fingerprint(card) and time.time() - fetched_at < self.ttl:
+                self.entries.move_to_end(card_id)
+                self.hits += 1
+                return details
+            del self.entries[card_id]
+        self.misses += 1
+        return None
+
+    def put(self, card, details):
+        card_id = str(card.get('cardId'))
+        self.entries[card_id] = [card_fingerprint(card), time.time(), details]
+        self.entries.move_to_end(card_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
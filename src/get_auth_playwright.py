@@ -4,11 +4,40 @@ from playwright.async_api import async_playwright
 from random_user_agent.user_agent import UserAgent
 
 
-async def oikotie_search_get_headers(headless=True, proxy_server=None,
-                                     proxy_username=None, proxy_password=None
-                                     ) -> dict:
+SEARCH_URL = "https://asunnot.oikotie.fi/myytavat-asunnot?pagination=2&cardType=100"
+
+
+async def _headers_from_context(browser) -> dict:
+    user_agent = UserAgent().get_random_user_agent()
+    context = await browser.new_context(user_agent=user_agent)
+    page = await context.new_page()
+
+    all_responses = []
+    def response_callback(response):
+        all_responses.append(response)
+
+    page.on("response", response_callback)
+    try:
+        await page.goto(SEARCH_URL)
+        await page.wait_for_load_state()
+        page.remove_listener("response", response_callback)
+    finally:
+        await page.close()
+        await context.close()
+
+    for response in all_responses:
+        request = response.request
+        if "ota-token" in str(request.headers):
+            Actor.log.info("Found token")
+            return request.headers
+    return None
+
+
+async def oikotie_search_get_headers_batch(count=1, headless=True, proxy_server=None,
+                                           proxy_username=None, proxy_password=None
+                                           ) -> list:
+    """Mint `count` header sets from one browser, each in its own context."""
     Actor.log.info("Starting Playwright Profile")
-    url = "https://asunnot.oikotie.fi/myytavat-asunnot?pagination=2&cardType=100"
     if proxy_server:
         proxy = {
             'server': proxy_server,
@@ -19,7 +48,6 @@ async def oikotie_search_get_headers(headless=True, proxy_server=None,
     else:
         proxy = None
         Actor.log.info("Running playwright without proxy")
-    user_agent = UserAgent().get_random_user_agent()
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(
@@ -35,50 +63,43 @@ async def oikotie_search_get_headers(headless=True, proxy_server=None,
                 '--disable-gpu'
             ]
         )
-        context = await browser.new_context(user_agent=user_agent)
-        page = await context.new_page()
-
-        all_responses = []        
-        def response_callback(response):
-            all_responses.append(response)
-
-        page.on("response", response_callback)
-        await page.goto(url)
-        await page.wait_for_load_state()
-        page.remove_listener("response", response_callback)
-
-        await page.close()
-        await context.close()
-        await browser.close()
+        try:
+            results = await asyncio.gather(*[_headers_from_context(browser) for _ in range(count)],
+                                           return_exceptions=True)
+        finally:
+            await browser.close()
         Actor.log.info("Got all responses, stopping Playwright resources")
 
-        for response in all_responses:
-            request = response.request
-            if "ota-token" in str(request.headers):
-                Actor.log.info("Found token")
-                return request.headers
-
-    return None
+    headers_list = []
+    for result in results:
+        if isinstance(result, Exception):
+            Actor.log.error(f"Error getting API headers: {result}")
+        elif result:
+            headers_list.append(result)
+    return headers_list
 
 
 async def setup_api_headers(headless=True,
                             proxy_server=None,
                             proxy_username=None, 
-                            proxy_password=None) -> dict:
-    """Setup API headers with retries, returns headers or raises an error after maximum retries."""
+                            proxy_password=None,
+                            count=1,
+                            retry_delay=60) -> list:
+    """Setup API headers with retries, returns up to `count` header sets or raises an error after maximum retries."""
     retries = 0
     while retries < 5:
         try:
-            api_headers = await oikotie_search_get_headers(
+            headers_list = await oikotie_search_get_headers_batch(
+                count,
                 headless=headless,
                 proxy_server=proxy_server,
                 proxy_username=proxy_username,
                 proxy_password=proxy_password
             )
-            if api_headers:
-                return api_headers
+            if headers_list:
+                return headers_list
         except Exception as e:
             Actor.log.error(f"Error getting API headers: {e}", exc_info=True)
-            await asyncio.sleep(43200)  # Retry after 12 hours
-            retries += 1
-    raise Exception("Failed to get API headers after 5 retries")
\ No newline at end of file
+        retries += 1
+        await asyncio.sleep(retry_delay * retries)
+    raise Exception("Failed to get API headers after 5 retries")
@@ -0,0 +1,180 @@
+import asyncio
+import base64
+import json
+import time
+from apify import Actor
+
+from src.get_auth_playwright import setup_api_headers
+from src.proxy_pool import playwright_proxy, proxy_key
+from src.stats import run_stats
+
+
+def token_expiry(api_headers, default_ttl=3600):
+    """Expiry of the `ota-token` as a unix timestamp, read from the JWT `exp` claim when there is one."""
+    token = api_headers.get('ota-token', '')
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:
+        return time.time() + default_ttl
+
+
+class HeaderPool:
+    """API header sets minted from one browser, cached in the key-value store and refreshed before they expire.
+
+    Behaves like the plain `headers_list` it replaces: crawlers index it and take its length. Header sets are
+    replaced in place, so a refreshed token is picked up by the next request that uses that slot.
+    With a `proxy_pool`, header sets are minted through proxies chosen by the pool and pinned to them, and a
+    header set whose proxy degrades is re-minted on a healthy one. Entries keep the credential-free
+    `proxy_key` of their proxy, so the cached header sets hold no proxy password. The `clients` of a
+    replaced header set are discarded from the `HttpClientPool`.
+    """
+
+    def __init__(self, size=1, store=None, key='API_HEADERS', ttl=3600, refresh_margin=300, proxy_pool=None,
+                 clients=None, **mint_kwargs):
+        self.size = size
+        self.proxy_pool = proxy_pool
+        self.clients = clients
+        self.store = store
+        self.key = key
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.mint_kwargs = mint_kwargs
+        self.entries = []
+        self._lock = asyncio.Lock()
+        self._minting = {}
+        self._refresher = None
+
+    @classmethod
+    def static(cls, headers_list):
+        """Pool of fixed header sets that are never refreshed, e.g. for replaying recorded responses."""
+        pool = cls(size=len(headers_list))
+        pool.entries = [{'headers': headers, 'expiresAt': float('inf')} for headers in headers_list]
+        return pool
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]['headers']
+
+    async def _mint(self, count, proxy_url=None):
+        if not self.proxy_pool:
+            with run_stats.timer('header_mint'):
+                headers_list = await setup_api_headers(count=count, **self.mint_kwargs)
+            run_stats.increment('headers_minted', len(headers_list))
+            return [{'headers': headers, 'expiresAt': token_expiry(headers, self.ttl)} for headers in headers_list]
+
+        counts = {}
+        for _ in range(count):  # Spread the header sets over the best proxies
+            chosen = proxy_url or self.proxy_pool.choose()
+            counts[chosen] = counts.get(chosen, 0) + 1
+        entries = []
+        for chosen, chosen_count in counts.items():
+            with run_stats.timer('header_mint'):
+                headers_list = await setup_api_headers(count=chosen_count,
+                                                       **{**self.mint_kwargs, **playwright_proxy(chosen)})
+            run_stats.increment('headers_minted', len(headers_list))
+            for headers in headers_list:
+                self.proxy_pool.pin(headers, chosen)
+                entries.append({'headers': headers, 'expiresAt': token_expiry(headers, self.ttl),
+                                'proxy': proxy_key(chosen)})
+        return entries
+
+    async def _save(self):
+        if self.store:
+            await self.store.set_value(self.key, self.entries)
+
+    def _is_fresh(self, entry):
+        return entry['expiresAt'] - self.refresh_margin > time.time()
+
+    def _proxy_url(self, entry):
+        return self.proxy_pool.url(entry.get('proxy')) if self.proxy_pool else None
+
+    def _is_usable(self, entry):
+        """Fresh and not pinned to a degraded proxy, as long as there is a healthy proxy to move to."""
+        if not self._is_fresh(entry):
+            return False
+        return not (self.proxy_pool and self.proxy_pool.is_degraded(self._proxy_url(entry))
+                    and self.proxy_pool.healthy())
+
+    async def start(self):
+        if self.store:
+            cached = await self.store.get_value(self.key) or []
+            if self.proxy_pool:  # Header sets only work from the proxy they were minted on
+                cached = [entry for entry in cached
+                          if entry.get('proxy') is None or self._proxy_url(entry)]
+            self.entries = [entry for entry in cached if self._is_fresh(entry)][:self.size]
+            for entry in self.entries if self.proxy_pool else ():
+                if entry.get('proxy') is None:  # Cached without a pool, or seeded by hand
+                    entry['proxy'] = proxy_key(self.proxy_pool.choose())
+                self.proxy_pool.pin(entry['headers'], self._proxy_url(entry))
+            Actor.log.info(f"Reusing {len(self.entries)} cached API header sets")
+        missing = self.size - len(self.entries)
+        if missing > 0:
+            self.entries += await self._mint(missing)
+            await self._save()
+        return self
+
+    def _index(self, token):
+        for index, entry in enumerate(self.entries):
+            if entry['headers'].get('ota-token') == token:
+                return index
+        return None
+
+    async def refresh(self, api_headers):
+        """Replace a rejected header set with a new one, returns the header set to retry with.
+
+        The browser mints outside the lock, so other header sets stay usable meanwhile, and requests rejected
+        with the same header set share one mint.
+        """
+        token = api_headers.get('ota-token')
+        async with self._lock:
+            index = self._index(token)
+            if index is None:  # Already replaced by another request
+                return self.entries[0]['headers'] if self.entries else api_headers
+            minting = self._minting.get(token)
+            if minting is None:
+                proxy_url = self._proxy_url(self.entries[index])
+                if self.proxy_pool and self.proxy_pool.is_degraded(proxy_url):
+                    proxy_url = None
+                minting = self._minting[token] = asyncio.ensure_future(self._replace(api_headers, proxy_url))
+        return await asyncio.shield(minting)
+
+    async def _replace(self, api_headers, proxy_url):
+        token = api_headers.get('ota-token')
+        Actor.log.info("Refreshing rejected API headers")
+        try:
+            try:
+                entries = await self._mint(1, proxy_url)
+            except Exception as e:
+                Actor.log.error(f"Failed to refresh API headers: {e}")
+                return api_headers
+            async with self._lock:
+                index = self._index(token)
+                if index is not None:
+                    self.entries[index:index + 1] = entries
+            await self._save()
+            if self.clients:
+                self.clients.discard(api_headers)
+            return entries[0]['headers']
+        finally:
+            self._minting.pop(token, None)
+
+    async def _refresh_expiring(self):
+        while True:
+            await asyncio.sleep(60)
+            for entry in list(self.entries):
+                if not self._is_usable(entry):
+                    await self.refresh(entry['headers'])
+
+    async def __aenter__(self):
+        self._refresher = asyncio.create_task(self._refresh_expiring())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        minting = list(self._minting.values())
+        for task in (self._refresher, *minting):
+            task.cancel()
+        await asyncio.gather(self._refresher, *minting, return_exceptions=True)
@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+from apify import Actor
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _header_key(api_headers):
+    if not api_headers:
+        return None
+    return api_headers.get('ota-token') or tuple(sorted(api_headers.items()))
+
+
+class HttpClientPool:
+    """Long-lived httpx clients keyed by proxy and header set, so connections are kept alive between requests."""
+
+    def __init__(self, max_connections=100, max_keepalive_connections=20,
+                 keepalive_expiry=30.0, http2=False, transport=None, event_hooks=None):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        if http2 and not _http2_available():
+            Actor.log.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.transport = transport
+        self.event_hooks = event_hooks or {}
+        self._clients = {}
+        self._closing = set()
+
+    def get(self, proxy_url=None, api_headers=None) -> httpx.AsyncClient:
+        key = (proxy_url, _header_key(api_headers))
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            proxies = {
+                'http://': proxy_url,
+                'https://': proxy_url
+            } if proxy_url else None
+            client = httpx.AsyncClient(proxies=proxies, headers=api_headers, limits=self.limits,
+                                       http2=self.http2, timeout=httpx.Timeout(30.0, connect=5.0),
+                                       transport=self.transport,
+                                       event_hooks=self.event_hooks)
+            self._clients[key] = client
+        return client
+
+    def discard(self, api_headers, grace=30.0):
+        """Drop the clients of a replaced header set. They are closed after `grace` seconds, so requests
+        already in flight on them can finish."""
+        header_key = _header_key(api_headers)
+        clients = [self._clients.pop(key) for key in list(self._clients) if key[1] == header_key]
+        if clients:
+            task = asyncio.create_task(self._close_later(clients, grace))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_later(clients, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            for client in clients:
+                await client.aclose()
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for task in list(self._closing):
+            task.cancel()
+        await asyncio.gather(*self._closing, return_exceptions=True)
+        for client in clients:
+            await client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
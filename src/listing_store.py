@@ -0,0 +1,175 @@
+import asyncio
+import json
+import math
+import sqlite3
+from apify import Actor
+
+# Queryable columns, the whole record is kept as JSON next to them
+INDEX_COLUMNS = (
+    ('cardId', 'INTEGER PRIMARY KEY'), ('cardType', 'INTEGER'), ('postalCode', 'TEXT'), ('city', 'TEXT'),
+    ('district', 'TEXT'), ('rooms', 'INTEGER'), ('price', 'REAL'), ('size', 'REAL'),
+    ('pricePerSquareMeter', 'REAL'), ('published', 'TEXT'), ('latitude', 'REAL'), ('longitude', 'REAL'),
+)
+INDEXED_COLUMNS = ('postalCode', 'city', 'price', 'pricePerSquareMeter', 'published')
+ORDER_COLUMNS = ('cardId', 'price', 'size', 'pricePerSquareMeter', 'published', 'rooms')
+FILTERS = {
+    'card_type': 'listings.cardType = ?',
+    'city': 'listings.city = ?',
+    'postal_code': 'listings.postalCode = ?',
+    'district': 'listings.district = ?',
+    'rooms': 'listings.rooms = ?',
+    'min_price': 'listings.price >= ?',
+    'max_price': 'listings.price <= ?',
+    'min_price_per_square_meter': 'listings.pricePerSquareMeter >= ?',
+    'max_price_per_square_meter': 'listings.pricePerSquareMeter <= ?',
+    'min_size': 'listings.size >= ?',
+    'max_size': 'listings.size <= ?',
+    'published_after': 'listings.published >= ?',
+    'published_before': 'listings.published < ?',
+}
+GEO_FILTERS = ('listings_geo.minLatitude >= ?', 'listings_geo.minLongitude >= ?',
+               'listings_geo.maxLatitude <= ?', 'listings_geo.maxLongitude <= ?')
+KM_PER_DEGREE = 111.32
+
+
+def _row(record):
+    """Column values of a record, rents fill `pricePerSquareMeter` from `revenuePerSquareMeter`."""
+    values = {name: record.get(name) for name, _ in INDEX_COLUMNS}
+    if values['pricePerSquareMeter'] is None:
+        values['pricePerSquareMeter'] = record.get('revenuePerSquareMeter')
+    if values['published'] is not None:
+        values['published'] = str(values['published'])
+    return (*values.values(), json.dumps(record, default=str))
+
+
+class ListingStore:
+    """Crawled listings in a local SQLite file, indexed for lookups by location, price and publication date.
+
+    Records stream in through `write` like any other sink and are upserted in batches of `batch_size` by cardId,
+    so the store holds the latest version of every listing seen by any run. Coordinates go to an R-tree for
+    bounding box and radius queries.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.upserted = 0
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{name} {column_type}' for name, column_type in INDEX_COLUMNS)
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS listings ({columns}, record TEXT NOT NULL)')
+        for name in INDEXED_COLUMNS:
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS listings_{name} ON listings ({name})')
+        self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS listings_geo USING rtree('
+                        'cardId, minLatitude, maxLatitude, minLongitude, maxLongitude)')
+        self._lock = asyncio.Lock()
+
+    def upsert(self, records):
+        """Insert or replace records by cardId in one transaction, returns the number of records stored."""
+        rows = [_row(record) for record in records if record.get('cardId') is not None]
+        names = [name for name, _ in INDEX_COLUMNS] + ['record']
+        updates = ', '.join(f'{name} = excluded.{name}' for name in names[1:])
+        latitude, longitude = names.index('latitude'), names.index('longitude')
+        geo_rows = [(row[0], row[latitude], row[latitude], row[longitude], row[longitude]) for row in rows
+                    if row[latitude] is not None and row[longitude] is not None]
+        self.db.execute('BEGIN')
+        try:
+            self.db.executemany(f"INSERT INTO listings ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                                f"ON CONFLICT (cardId) DO UPDATE SET {updates}", rows)
+            self.db.executemany('DELETE FROM listings_geo WHERE cardId = ?', [(row[0],) for row in rows])
+            self.db.executemany('INSERT INTO listings_geo VALUES (?, ?, ?, ?, ?)', geo_rows)
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    async def write(self, key, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        batch, self.buffer = self.buffer, []
+        if batch:
+            async with self._lock:
+                self.upserted += await asyncio.to_thread(self.upsert, batch)
+
+    def query(self, order_by='published', descending=True, limit=100, offset=0, **filters):
+        """Listing records matching every filter of `FILTERS` given, e.g.
+        `query(rooms=2, postal_code='00100', max_price_per_square_meter=4000)`.
+
+        `bbox` is `(min_latitude, min_longitude, max_latitude, max_longitude)`, `published_after` and
+        `published_before` are datetimes or `YYYY-MM-DD[ HH:MM:SS]` strings.
+        """
+        where, params = self._filters(filters)
+        if order_by not in ORDER_COLUMNS:
+            raise ValueError(f"Cannot order by {order_by}, use one of {ORDER_COLUMNS}")
+        sql = f"SELECT listings.record FROM {self._source(filters.get('bbox'))} {where} " \
+              f"ORDER BY listings.{order_by} {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?"
+        return [json.loads(row['record']) for row in self.db.execute(sql, [*params, limit, offset])]
+
+    def count(self, **filters):
+        where, params = self._filters(filters)
+        return self.db.execute(f"SELECT COUNT(*) FROM {self._source(filters.get('bbox'))} {where}",
+                               params).fetchone()[0]
+
+    def near(self, latitude, longitude, radius_km, limit=100, **filters):
+        """Listings within `radius_km` of a point, nearest first."""
+        delta_latitude = radius_km / KM_PER_DEGREE
+        delta_longitude = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        bbox = (latitude - delta_latitude, longitude - delta_longitude,
+                latitude + delta_latitude, longitude + delta_longitude)
+        candidates = self.query(bbox=bbox, limit=-1, **filters)  # The R-tree narrows it down to the box
+        found = []
+        for record in candidates:
+            distance = _distance_km(latitude, longitude, record['latitude'], record['longitude'])
+            if distance <= radius_km:
+                found.append((distance, record))
+        found.sort(key=lambda item: item[0])
+        return [record for _, record in found[:limit]]
+
+    @staticmethod
+    def _source(bbox):
+        if bbox is None:
+            return 'listings'
+        return 'listings JOIN listings_geo ON listings_geo.cardId = listings.cardId'
+
+    @staticmethod
+    def _filters(filters):
+        conditions, params = [], []
+        for name, value in filters.items():
+            if name == 'bbox' or value is None:
+                continue
+            if name not in FILTERS:
+                raise TypeError(f"Unknown listing filter {name}, use one of {tuple(FILTERS)} or bbox")
+            conditions.append(FILTERS[name])
+            params.append(str(value) if name.startswith('published') else value)
+        if filters.get('bbox') is not None:
+            conditions += GEO_FILTERS
+            params += list(filters['bbox'])
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+    async def close(self):
+        await self.flush()
+        count = self.db.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+        self.db.execute('PRAGMA optimize')
+        self.db.close()
+        Actor.log.info(f"Upserted {self.upserted} records to {self.path}, which holds {count} listings")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Great circle distance."""
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((latitude2 - latitude1) / 2) ** 2 + \
+        math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
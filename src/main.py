@@ -8,77 +8,513 @@ https://docs.apify.com/sdk/python
 """
 
 import asyncio
+import hashlib
+import json
 import os
+import time
+from contextlib import AsyncExitStack, aclosing, nullcontext
+from datetime import datetime
 import dotenv
 dotenv.load_dotenv()
 
 from apify import Actor
 
-from src.get_auth_playwright import setup_api_headers
-from src.crawlers import deal_crawler_generator, rent_crawler_generator, fetch_card_details
+from src.header_pool import HeaderPool
+from src.crawlers import deal_crawler_generator, rent_crawler_generator, fetch_card_details, SLEEP_TIME, \
+    SEARCHES, PAGE_SIZE, plan_shards, fetch_cards_with_retries, pick_headers
+from src.http_client import HttpClientPool
+from src.pipeline import DetailPipeline
+from src.watermark import Watermark
+from src.detail_cache import DetailCache
+from src.sinks import BufferedStoreWriter, TeeWriter
+from src.rate_limiter import RateController
+from src.dedup import CompanyIndex
+from src.checkpoint import Checkpoint
+from src.changes import ChangeTracker, SNAPSHOT_IGNORED_FIELDS
+from src.columnar import ParquetSink, parquet_available
+from src.listing_store import ListingStore
+from src.cassette import CassetteRecorder, CassetteReplayer
+from src.proxy_pool import ProxyPool, build_proxy_urls
+from src.priority import DetailPriority, RequestBudget
+from src.parsers import set_parser_backend, set_parse_executor, shutdown_parse_executor
+from src.stats import run_stats
+from src.work_queue import open_work_queue
 
 # To run this Actor locally, you need to have the Playwright browsers installed.
 # Run `playwright install --with-deps` in the Actor's virtual environment to install them.
 # When running on the Apify platform, they are already included in the Actor's Docker image.
 
-async def update_deal_details(deal, oikotie_deals_dataset: Actor, 
-                                       proxy_url=None):
-    deal_url = deal.get('url')
-    more_details = await fetch_card_details(deal_url, proxy_url)
-    deal.update(more_details.__dict__)
+async def update_deal_details(deal, cards_writer: BufferedStoreWriter, clients,
+                              proxy_pool=None, detail_cache=None, rate_controller=None, checkpoint=None,
+                              change_tracker=None, events_writer=None, export_writer=None, budget=None):
+    """Write a card with its details, returns False when they could not be fetched. Such cards are not
+    written, so the stored record is kept, and stay in the checkpoint's pending cards for the next run."""
+    details = detail_cache.get(deal) if detail_cache else None
+    if details is None:
+        if budget and not budget.take():
+            return False
+        deal_url = deal.get('url')
+        more_details = await fetch_card_details(clients, deal_url, proxy_pool, rate_controller)
+        if not more_details:
+            return False
+        details = more_details.to_dict()
+        if detail_cache:
+            detail_cache.put(deal, details)
+    deal.update(details)
     card_id = str(deal.get('cardId'))
-    await oikotie_deals_dataset.set_value(card_id, deal)
+    if export_writer:
+        await export_writer.write(card_id, deal)
+    changed = True
+    if change_tracker:
+        changed, events, state = change_tracker.observe(deal)
+        for event in events:
+            await events_writer.write(f"{event['type']}|{card_id}", event)
+    if changed:
+        await cards_writer.write(card_id, deal)
+    if change_tracker:
+        change_tracker.record(card_id, state)
+    if checkpoint:
+        checkpoint.pending_cards.pop(card_id, None)
+    return True
+
+
+MARKETS = {
+    'deal': (deal_crawler_generator, 'oikotie-deals'),
+    'rent': (rent_crawler_generator, 'oikotie-rents'),
+}
+
+
+async def crawl_market(crawler_mode, actor_input, crawler_state, clients, headers_list, proxy_pool,
+                       search_rate, detail_rate, companies_writer, company_index,
+                       num_workers, search_concurrency, export_writer=None, detail_budget=None):
+    """Crawl one market with its own cards store, cache, watermark and checkpoint.
+
+    The clients, header pool, rate controllers, companies writer and detail budget may be shared with other
+    markets. Once the budget is spent the search stops, and the ids of the cards left over are kept for the
+    fresh search of the next run, which ranks them first when it finds them again.
+    """
+    crawler_generator, store_name = MARKETS[crawler_mode]
+    detail_queue_size = actor_input.get('detail_queue_size', num_workers * 4)
+    ordered_batches = actor_input.get('ordered_batches', True)
+    shard_threshold = actor_input.get('search_shard_threshold', 2400)
+    oikotie_cards_dataset = await Actor.open_key_value_store(name=store_name)
+
+    detail_cache = None
+    if actor_input.get('detail_cache', True):
+        detail_cache_key = f'DETAIL_CACHE_{crawler_mode.upper()}'
+        detail_cache = await DetailCache.load(crawler_state, detail_cache_key,
+                                              ttl=actor_input.get('detail_cache_ttl_hours', 72)*3600,
+                                              max_entries=actor_input.get('detail_cache_max_entries', 50000))
+
+    watermark = None
+    if actor_input.get('incremental', False):
+        watermark_key = f'WATERMARK_{crawler_mode.upper()}'
+        watermark = await Watermark.load(crawler_state, watermark_key,
+                                         margin_pages=actor_input.get('incremental_margin_pages', 2))
+        Actor.log.info(f"Incremental {crawler_mode} crawl from watermark {watermark.published}")
+        ordered_batches = True  # The margin is counted in offset order
+        shard_threshold = None  # Shards are merged out of published order
+
+    cards_writer = BufferedStoreWriter(oikotie_cards_dataset, actor_input.get('write_buffer_size', 500),
+                                       actor_input.get('write_buffer_seconds', 10))
+
+    checkpoint_key = f'CHECKPOINT_{crawler_mode.upper()}'
+    if actor_input.get('resume', True):
+        checkpoint = await Checkpoint.load(crawler_state, checkpoint_key)
+    else:
+        checkpoint = Checkpoint()
+
+    change_tracker, events_writer, savers = None, None, ()
+    if actor_input.get('change_tracking', False):
+        change_state_key = f'CARD_STATE_{crawler_mode.upper()}'
+        change_tracker = await ChangeTracker.load(crawler_state, change_state_key, new_crawl=not checkpoint.started,
+                                                  ignore=actor_input.get('snapshot_ignore_fields',
+                                                                         SNAPSHOT_IGNORED_FIELDS))
+        events_dataset = await Actor.open_dataset(name=f'oikotie-{crawler_mode}-changes')
+        events_writer = BufferedStoreWriter(events_dataset, actor_input.get('write_buffer_size', 500),
+                                            actor_input.get('write_buffer_seconds', 10))
+        savers = (lambda: change_tracker.save(crawler_state, change_state_key, change_tracker.snapshot()),)
+    writers = (cards_writer, companies_writer, *([events_writer] if events_writer else []))
+    detail_args = (cards_writer, clients, proxy_pool, detail_cache, detail_rate, checkpoint, change_tracker,
+                   events_writer, export_writer, detail_budget)
+    priority = None
+    if actor_input.get('detail_priority', False):
+        priority = DetailPriority(detail_cache, change_tracker, actor_input.get('detail_priority_weights'),
+                                  checkpoint.skipped_cards)
+        # The queue is the window cards are reordered in, so it is much larger than the worker pool
+        detail_queue_size = actor_input.get('detail_priority_window', 1000)
+
+    batches = crawler_generator(clients, headers_list, proxy_pool, search_concurrency, ordered_batches,
+                                search_rate, checkpoint, shard_threshold)
+    checkpoint_interval = actor_input.get('checkpoint_interval_seconds', 60)
+    async with events_writer or nullcontext():
+        async with cards_writer, \
+                checkpoint.autosave(crawler_state, checkpoint_key, checkpoint_interval, writers, savers), \
+                DetailPipeline(update_deal_details, num_workers, detail_queue_size, priority) as pipeline, \
+                aclosing(batches):
+            for card in list(checkpoint.pending_cards.values()):
+                await pipeline.put(card, *detail_args)
+            async for cards, companies in batches:
+                for card in cards:
+                    checkpoint.pending_cards[str(card.get('cardId'))] = card
+                    await pipeline.put(card, *detail_args)
+                for company in companies:
+                    if not company_index.is_new_or_changed(company):
+                        continue
+                    company_id = str(company.get('companyId'))
+                    await companies_writer.write(company_id, company)
+                if watermark and watermark.observe(cards):
+                    Actor.log.info(f"Moved {watermark.margin_pages} {crawler_mode} pages past the watermark, stopping")
+                    checkpoint.completed = True
+                    break
+                if detail_budget and detail_budget.exhausted:
+                    Actor.log.info(f"Detail budget spent, stopping the {crawler_mode} search")
+                    break
+        cut_short = bool(detail_budget and detail_budget.exhausted
+                         and (checkpoint.pending_cards or not checkpoint.completed))
+        if change_tracker and checkpoint.completed and not watermark and not checkpoint.has_gaps \
+                and not checkpoint.pending_cards:
+            delisted = change_tracker.delisted()
+            for event in delisted:
+                await events_writer.write(f"delisted|{event['cardId']}", event)
+            Actor.log.info(f"{len(delisted)} {crawler_mode} listings delisted since the previous crawl")
+    await companies_writer.flush()  # Pending cards are dropped from the checkpoint, so their companies must be written
+    if change_tracker:
+        Actor.log.info(f"Skipped {change_tracker.unchanged} unchanged {crawler_mode} records")
+        await change_tracker.save(crawler_state, change_state_key)
+    if cut_short:
+        # A fresh search finds the cards again, so only their ids are kept
+        Actor.log.info(f"Detail budget spent, {len(checkpoint.pending_cards)} {crawler_mode} cards left for the next run")
+        await Checkpoint(skipped_cards=list(checkpoint.pending_cards)).save(crawler_state, checkpoint_key)
+    elif checkpoint.completed and checkpoint.pending_cards:
+        # The next run retries them before a fresh crawl
+        Actor.log.warning(f"Failed to fetch details of {len(checkpoint.pending_cards)} {crawler_mode} cards, "
+                          f"left for the next run")
+        await Checkpoint(pending_cards=checkpoint.pending_cards).save(crawler_state, checkpoint_key)
+    elif checkpoint.completed:
+        await checkpoint.clear(crawler_state, checkpoint_key)
+    else:
+        await checkpoint.save(crawler_state, checkpoint_key)
+
+    if detail_cache:
+        Actor.log.info(f"{crawler_mode} detail cache hits: {detail_cache.hits}, misses: {detail_cache.misses}")
+        await detail_cache.save(crawler_state, detail_cache_key)
+    if watermark:
+        await watermark.save(crawler_state, watermark_key)
+
+
+def search_item(crawl_id, market, params, offset, expand=False):
+    params_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    key = f"{crawl_id}|search|{market}|{params_hash}|{offset}"
+    return key, {'type': 'search', 'crawl': crawl_id, 'market': market, 'params': params, 'offset': offset,
+                 'expand': expand}
+
+
+async def enqueue_searches(work_queue, markets, clients, headers_list, proxy_pool, search_rate, shard_threshold):
+    """Seed the work queue with the first page of every search shard, workers enqueue the remaining pages."""
+    crawl_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+    items = []
+    for market in markets:
+        params, _, label = SEARCHES[market]
+        shards = await plan_shards(clients, params, headers_list, shard_threshold, proxy_pool,
+                                   search_rate) if shard_threshold else [params]
+        items += [search_item(crawl_id, market, shard_params, 0, expand=True) for shard_params in shards]
+        Actor.log.info(f"Enqueued {len(shards)} {label} search shards for crawl {crawl_id}")
+    await work_queue.add(items)
+
+
+async def run_worker(work_queue, actor_input, crawler_state, clients, headers_list, proxy_pool,
+                     search_rate, detail_rate, companies_writer, company_index, num_workers, export_writer=None):
+    """Lease and handle search page and detail items from the work queue until it is finished.
+
+    Search pages enqueue a detail item per card, and the first page of a shard enqueues the rest of the
+    shard. Items are completed only after the records they produced are flushed, so an item of a crashed
+    worker becomes visible again after `visibility_timeout_seconds` and is redone by another worker.
+    """
+    visibility_timeout = actor_input.get('visibility_timeout_seconds', 300)
+    idle_timeout = actor_input.get('worker_idle_seconds', 120)
+    max_attempts = actor_input.get('max_attempts', 3)
+    write_buffer_size = actor_input.get('write_buffer_size', 500)
+    write_buffer_seconds = actor_input.get('write_buffer_seconds', 10)
+    cards_writers, detail_caches, handled = {}, {}, []
+    writers_stack = AsyncExitStack()
+    header_index = 0
+    handled_any = False
+
+    async def handle_search(payload):
+        nonlocal header_index
+        market, offset = payload['market'], payload['offset']
+        _, extract_cards, label = SEARCHES[market]
+        api_headers = pick_headers(headers_list, header_index, proxy_pool)
+        header_index += 1
+        cards, total_card = await fetch_cards_with_retries(clients, payload['params'], api_headers, offset,
+                                                           proxy=proxy_pool, header_pool=headers_list,
+                                                           rate_controller=search_rate)
+        if not cards:
+            raise RuntimeError(f"Failed to fetch {label} at offset {offset}")
+        items, companies = extract_cards(cards)
+        await work_queue.add([(f"{payload['crawl']}|detail|{market}|{item.get('cardId')}",
+                               {'type': 'detail', 'market': market, 'url': item.get('url'), 'card': item})
+                              for item in items], forefront=True)
+        for company in companies:
+            if company_index.is_new_or_changed(company):
+                await companies_writer.write(str(company.get('companyId')), company)
+        if payload.get('expand'):
+            await work_queue.add([search_item(payload['crawl'], market, payload['params'], next_offset)
+                                  for next_offset in range(offset + PAGE_SIZE, total_card, PAGE_SIZE)])
+        Actor.log.info(f"Fetched cards at offset {offset}, got {len(items)} {label} and {len(companies)} companies.")
+
+    async def handle_detail(payload):
+        market = payload['market']
+        if not await update_deal_details(payload['card'], cards_writers[market], clients, proxy_pool,
+                                         detail_caches.get(market), detail_rate, export_writer=export_writer):
+            raise RuntimeError(f"Failed to fetch details of {payload['url']}")
+
+    async def acknowledge():
+        """Flush the written records, then complete the items that produced them."""
+        nonlocal handled
+        batch, handled = handled, []
+        for writer in [*cards_writers.values(), companies_writer]:
+            await writer.flush()
+        if batch:
+            await work_queue.complete(batch)
+
+    async def acknowledge_periodically():
+        while True:
+            await asyncio.sleep(write_buffer_seconds)
+            try:
+                await acknowledge()
+            except Exception as e:
+                Actor.log.error(f"Failed to complete work items: {e}", exc_info=True)
+
+    async def work():
+        nonlocal handled_any
+        idle_since = time.monotonic()
+        while True:
+            items = await work_queue.lease(1, visibility_timeout)
+            if not items:
+                idle = time.monotonic() - idle_since
+                if idle > idle_timeout or (handled_any and await work_queue.is_finished()):
+                    return
+                await asyncio.sleep(1)
+                continue
+            idle_since = time.monotonic()
+            item = items[0]
+            if item.attempts > max_attempts:  # The workers of the earlier attempts died holding it
+                Actor.log.error(f"Giving up on {item.key} after {item.attempts - 1} attempts")
+                handled.append(item)
+                continue
+            try:
+                if item.payload.get('type') == 'search':
+                    await handle_search(item.payload)
+                else:
+                    await handle_detail(item.payload)
+                handled.append(item)
+            except Exception as e:
+                if item.attempts >= max_attempts:
+                    Actor.log.error(f"Giving up on {item.key} after {item.attempts} attempts: {e}")
+                    handled.append(item)
+                else:
+                    Actor.log.warning(f"Failed to handle {item.key}, releasing it: {e}")
+                    await work_queue.release(item)
+            handled_any = True
+
+    # Items of any market may be leased, so every market's store and cache is opened before the workers start
+    for market, (_, store_name) in MARKETS.items():
+        store = await Actor.open_key_value_store(name=store_name)
+        cards_writers[market] = await writers_stack.enter_async_context(
+            BufferedStoreWriter(store, write_buffer_size, write_buffer_seconds))
+        if actor_input.get('detail_cache', True):
+            detail_caches[market] = await DetailCache.load(crawler_state, f'DETAIL_CACHE_{market.upper()}',
+                                                           ttl=actor_input.get('detail_cache_ttl_hours', 72)*3600,
+                                                           max_entries=actor_input.get('detail_cache_max_entries',
+                                                                                       50000))
+    acknowledger = asyncio.create_task(acknowledge_periodically())
+    try:
+        await asyncio.gather(*[work() for _ in range(max(1, num_workers))])
+    finally:
+        acknowledger.cancel()
+        await asyncio.gather(acknowledger, return_exceptions=True)
+        await acknowledge()
+        await writers_stack.aclose()
+        for market, detail_cache in detail_caches.items():
+            await detail_cache.save(crawler_state, f'DETAIL_CACHE_{market.upper()}')
+
+
+# Replay re-parses recorded responses from disk, so it needs no pacing and must not touch the state of live crawls
+REPLAY_RATE = 1e6
+REPLAY_OVERRIDES = {
+    'role': 'standalone',
+    'resume': False,
+    'incremental': False,
+    'detail_cache': False,
+    'search_rate': REPLAY_RATE,
+    'search_max_rate': REPLAY_RATE,
+    'detail_rate': REPLAY_RATE,
+    'detail_max_rate': REPLAY_RATE,
+}
 
 
 async def main() -> None:
     async with Actor:
+        actor_input = await Actor.get_input() or {}
+        cassette_mode = actor_input.get('cassette_mode')
+        cassette_dir = actor_input.get('cassette_dir', 'cassettes')
+        cassette_store_name = actor_input.get('cassette_store', 'oikotie-cassettes')
+        cassette_store = await Actor.open_key_value_store(name=cassette_store_name) \
+            if cassette_mode and cassette_store_name else None
+
         proxy_server = os.getenv("PROXY_SERVER")
         proxy_username = os.getenv("PROXY_USERNAME")
         proxy_password = os.getenv("PROXY_PASSWORD")
-        proxy_url = f"http://{proxy_username}:{proxy_password}@{proxy_server}"
-        if not proxy_server or not proxy_username or not proxy_password:
+        if cassette_mode == 'replay':
+            actor_input = {**actor_input, **REPLAY_OVERRIDES}
+            proxy_pool = None
+        elif not proxy_server or not proxy_username or not proxy_password:
             Actor.log.error("Proxy not set up, exiting")
             return
+        else:
+            # PROXY_SERVER may list several endpoints, each optionally split into session-suffixed usernames
+            proxy_pool = ProxyPool(build_proxy_urls(proxy_server, proxy_username, proxy_password,
+                                                   actor_input.get('proxy_sessions', 0),
+                                                   actor_input.get('proxy_session_template',
+                                                                   '{username}-session-{session}')),
+                                  max_error_rate=actor_input.get('proxy_max_error_rate', 0.3),
+                                  max_latency=actor_input.get('proxy_max_latency_seconds', 10),
+                                  cooldown=actor_input.get('proxy_cooldown_seconds', 120))
+            Actor.log.info(f"Using a pool of {len(proxy_pool)} proxies")
 
-        actor_input = await Actor.get_input() or {}
         crawler_mode = actor_input.get('crawler_mode', 'deal')
         Actor.log.info(f"Starting crawler with mode: {crawler_mode}")
-        num_workers = actor_input.get('num_workers', 1)
+        if crawler_mode == 'all':
+            markets = list(MARKETS)
+        elif crawler_mode in MARKETS:
+            markets = [crawler_mode]
+        else:
+            Actor.log.error(f"Invalid crawler mode: {crawler_mode}")
+            return
+        # The worker and search budgets are shared by all crawled markets
+        num_workers = max(1, actor_input.get('num_workers', 24) // len(markets))
+        search_concurrency = max(1, actor_input.get('search_concurrency', 4) // len(markets))
+        num_headers = actor_input.get('num_headers', 1)
+        set_parser_backend(actor_input.get('parser_backend'))
 
-        headers_list = [await setup_api_headers(headless=True, proxy_server=proxy_server, 
-                                                proxy_username=proxy_username, 
-                                                proxy_password=proxy_password)
-                        for _ in range(num_workers)]
-        headers_list = [headers for headers in headers_list if headers]
+        recorder, replayer = None, None
+        if cassette_mode == 'record':
+            recorder = CassetteRecorder(cassette_dir, cassette_store,
+                                        actor_input.get('cassette_segment_mb', 8) * 1024 * 1024)
+        elif cassette_mode == 'replay':
+            if cassette_store:
+                replayer = await CassetteReplayer.download(cassette_store, cassette_dir)
+            else:
+                replayer = CassetteReplayer(cassette_dir)
+
+        clients = HttpClientPool(max_connections=actor_input.get('max_connections', 100),
+                                 max_keepalive_connections=actor_input.get('max_keepalive_connections', 20),
+                                 http2=actor_input.get('http2', False), transport=replayer,
+                                 event_hooks={'response': [recorder.record_response]} if recorder else None)
+
+        if cassette_mode == 'replay':
+            crawler_state = await Actor.open_key_value_store(name='oikotie-replay-state')
+            headers_list = HeaderPool.static([{'ota-token': 'replay'}])
+        else:
+            crawler_state = await Actor.open_key_value_store(name='oikotie-crawler-state')
+            headers_list = HeaderPool(size=num_headers, store=crawler_state,
+                                      ttl=actor_input.get('token_ttl_seconds', 3600),
+                                      proxy_pool=proxy_pool, clients=clients, headless=True)
+            await headers_list.start()
 
         Actor.log.info(f"Got new api headers, starting crawler with {len(headers_list)} headers")
         if not headers_list:
             Actor.log.error("Failed to get API headers")
             return
-        
-        if crawler_mode == 'deal':
-            oikotie_deals_dataset = await Actor.open_key_value_store(name='oikotie-deals')
-            oikotie_companies_dataset = await Actor.open_key_value_store(name='oikotie-companies')
-
-            deal_crawler_generator_task = deal_crawler_generator(headers_list, proxy_url)
-            async for deals, companies in deal_crawler_generator_task:
-                deal_tasks = [update_deal_details(deal, oikotie_deals_dataset, proxy_url) for deal in deals]
-                await asyncio.gather(*deal_tasks)
-                for company in companies:
-                    company_id = str(company.get('companyId'))
-                    await oikotie_companies_dataset.set_value(company_id, company)
-        elif crawler_mode == 'rent':
-            oikotie_rents_dataset = await Actor.open_key_value_store(name='oikotie-rents')
-            oikotie_companies_dataset = await Actor.open_key_value_store(name='oikotie-companies')
-
-            rent_crawler_generator_task = rent_crawler_generator(headers_list, proxy_url)
-            async for rents, companies in rent_crawler_generator_task:
-                rent_tasks = [update_deal_details(rent, oikotie_rents_dataset) for rent in rents]
-                await asyncio.gather(*rent_tasks)
-                for company in companies:
-                    company_id = str(company.get('companyId'))
-                    await oikotie_companies_dataset.set_value(company_id, company)
-        else:
-            Actor.log.error(f"Invalid crawler mode: {crawler_mode}")
 
-    
\ No newline at end of file
+        set_parse_executor(actor_input.get('parse_executor'), actor_input.get('parse_workers'))
+
+        stats_interval = actor_input.get('stats_interval_seconds', 30)
+        try:
+            async with clients, headers_list, run_stats.autosave(crawler_state, 'RUN_STATS', stats_interval), \
+                    run_stats.serve(actor_input.get('stats_port'), actor_input.get('stats_host', '127.0.0.1')):
+                oikotie_companies_dataset = await Actor.open_key_value_store(name='oikotie-companies')
+                persist_company_index = actor_input.get('persist_company_index', False)
+                if persist_company_index:
+                    company_index = await CompanyIndex.load(crawler_state, 'COMPANY_INDEX')
+                else:
+                    company_index = CompanyIndex()
+                companies_writer = BufferedStoreWriter(oikotie_companies_dataset,
+                                                       actor_input.get('write_buffer_size', 500),
+                                                       actor_input.get('write_buffer_seconds', 10))
+
+                search_rate = RateController(initial_rate=actor_input.get('search_rate', 1/SLEEP_TIME),
+                                             max_rate=actor_input.get('search_max_rate', 5))
+                detail_rate = RateController(initial_rate=actor_input.get('detail_rate', 10),
+                                             max_rate=actor_input.get('detail_max_rate', 50), burst=5)
+
+                detail_budget = RequestBudget(actor_input.get('detail_budget') or None)
+
+                exporters = []
+                if actor_input.get('parquet_export', False):
+                    if parquet_available():
+                        parquet_store_name = actor_input.get('parquet_store', 'oikotie-parquet')
+                        parquet_store = await Actor.open_key_value_store(name=parquet_store_name) \
+                            if parquet_store_name else None
+                        exporters.append(ParquetSink(actor_input.get('parquet_dir', 'parquet'),
+                                                     actor_input.get('parquet_row_group_size', 10000),
+                                                     parquet_store))
+                    else:
+                        Actor.log.warning("Parquet export requested but pyarrow is not installed, skipping it")
+                if actor_input.get('listing_store', False):
+                    exporters.append(ListingStore(actor_input.get('listing_store_path', 'listings.sqlite3'),
+                                                  actor_input.get('listing_store_batch_size', 1000)))
+                export_writer = TeeWriter(*exporters) if len(exporters) > 1 else next(iter(exporters), None)
+
+                role = actor_input.get('role', 'standalone')
+                async with companies_writer, export_writer or nullcontext():
+                    if role == 'standalone':
+                        labels = markets
+                        results = await asyncio.gather(*[
+                            crawl_market(market, actor_input, crawler_state, clients, headers_list, proxy_pool,
+                                         search_rate, detail_rate, companies_writer, company_index,
+                                         num_workers, search_concurrency, export_writer, detail_budget)
+                            for market in markets
+                        ], return_exceptions=True)
+                    else:
+                        labels = [role]
+                        work_queue = await open_work_queue(actor_input.get('work_queue_backend', 'apify'),
+                                                           actor_input.get('work_queue_name', 'oikotie-work'),
+                                                           actor_input.get('work_queue_path'))
+                        try:
+                            if role == 'coordinator':
+                                await enqueue_searches(work_queue, markets, clients, headers_list, proxy_pool,
+                                                       search_rate, actor_input.get('search_shard_threshold', 2400))
+                            results = await asyncio.gather(
+                                run_worker(work_queue, actor_input, crawler_state, clients, headers_list, proxy_pool,
+                                           search_rate, detail_rate, companies_writer, company_index,
+                                           actor_input.get('num_workers', 24), export_writer),
+                                return_exceptions=True)
+                        finally:
+                            work_queue.close()
+                failures = [result for result in results if isinstance(result, BaseException)]
+                for label, result in zip(labels, results):
+                    if isinstance(result, BaseException):
+                        Actor.log.error(f"Crawling {label} failed: {result}", exc_info=result)
+
+                Actor.log.info(f"Final search rates: {search_rate.current_rates()}")
+                Actor.log.info(f"Final detail rates: {detail_rate.current_rates()}")
+                if detail_budget.limit is not None:
+                    Actor.log.info(f"Spent {detail_budget.spent} of {detail_budget.limit} detail requests, "
+                                   f"skipped {detail_budget.skipped}")
+                if proxy_pool:
+                    Actor.log.info(f"Final proxy health: {proxy_pool.summary()}")
+                Actor.log.info(f"Stage timings: {run_stats.snapshot()['stages']}")
+                Actor.log.info(f"Skipped {company_index.skipped} unchanged companies")
+                if persist_company_index:
+                    await company_index.save(crawler_state, 'COMPANY_INDEX')
+                if failures:
+                    raise failures[0]
+        finally:
+            shutdown_parse_executor()
+            if recorder:
+                await recorder.close()
+            if replayer:
+                Actor.log.info(f"Replayed {replayer.replayed} responses, {replayer.missing} requests were not recorded")
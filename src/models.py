@@ -9,236 +9,180 @@ def str_to_datetime(date_text):
         return datetime.strptime(str(date_text), '%Y-%m-%d %H:%M:%S')
 
 
-class Company:
-    def __init__(self, data):
-        if data.get('company'):
-            self.companyId = data.get('company', {}).get('companyId')
-            self.name = data.get('company', {}).get('companyName')
-            self.logoSmall = data.get('company', {}).get('logoSmall')
-            self.updatedAt = datetime.now()
+def decode_text(text):
+    if not text:
+        return None
+    else:
+        text = text.encode("utf-8").decode("utf-8").strip()
+        text = " ".join(text.split())
+        return text
 
 
-class Deal:
-    def __init__(self, data):
-        self.cardId = data.get('cardId')
-        self.url = data.get('url')
-        # self.condition =
-        self.updatedAt = datetime.now()
-        self.status = data.get('status')
-        self.cardType = data.get('cardType')
-        self.cardSubType = data.get('cardSubType')
-        if data.get('data', {}):
-            self.roomConfiguration = data.get('data', {}).get('roomConfiguration')
-            self.buildYear = data.get('data', {}).get('buildYear')
-            self.priceText = self._decode_text(data.get('data', {}).get('price'))
-            self.price, self.priceCurrency = self._get_price()
-            # self.priceCycle = - for Rent
-            self.sizeText = data.get('data', {}).get('size')
-            self.size, self.sizeUnit = self._get_size()
-            self.pricePerSquareMeter = self._get_price_per_square_meter()
-            self.description = data.get('data', {}).get('description')
-            self.rooms = data.get('data', {}).get('rooms')
-            self.sizeLot = data.get('data', {}).get('sizeLot')
-            self.sizeMin = data.get('data', {}).get('sizeMin')
-            self.sizeMax = data.get('data', {}).get('sizeMax')
-            self.newDevelopment = data.get('data', {}).get('newDevelopment')
-            self.isOnlineOffer = data.get('data', {}).get('isOnlineOffer')
-            self.extraVisibility = data.get('data', {}).get('extraVisibility')
-            self.visits = data.get('data', {}).get('visits')
-            self.visitsWeekly = data.get('data', {}).get('visitsWeekly')
-        if data.get('location', {}):
-            self.district = data.get('location', {}).get('district')
-            self.city = data.get('location', {}).get('city')
-            self.country = data.get('location', {}).get('country')
-            self.address = data.get('location', {}).get('address')
-            self.latitude = data.get('location', {}).get('latitude')
-            self.longitude = data.get('location', {}).get('longitude')
-        if data.get('meta', {}):
-            self.published = str_to_datetime(data.get('meta', {}).get('published'))
-            self.contractType = data.get('meta', {}).get('contractType')
-            self.listingType = data.get('meta', {}).get('listingType')
-            self.sellStatus = data.get('meta', {}).get('sellStatus')
-            self.priceChanged = str_to_datetime(data.get('meta', {}).get('priceChanged'))
-        medias = data.get('medias', [])
-        if medias:
-            self.image1 = medias[0].get('imageLargeJPEG')
-            if len(medias) > 1:
-                self.image2 = medias[1].get('imageLargeJPEG')
-            if len(medias) > 2:
-                self.image3 = medias[2].get('imageLargeJPEG')
-            if len(medias) > 3:
-                self.image4 = medias[3].get('imageLargeJPEG')
-        if data.get('company'):
-            self.companyId = data.get('company', {}).get('companyId')
-
-
-    def _decode_text(self, text):
-        if not text:
-            return None
-        else:
-            text = text.encode("utf-8").decode("utf-8").strip()
-            text = " ".join(text.split())
-            return text
+def parse_number(parts):
+    """['1', '234,50'] -> 1234.5, None when the parts are not a number.
 
+    The comma is read as the Finnish decimal separator for prices as it always was for sizes, so a rent like
+    '1 234,50 € / kk' is 1234.5 where it used to be None.
+    """
+    try:
+        return float("".join(parts).replace(",", "."))
+    except ValueError:
+        return None
 
-    def _get_price(self):
-        if not self.priceText:
-            return None, None
-        else:
-            currency = self.priceText.split()[-1]
-            price = "".join(self.priceText.split()[:-1])
-            try:
-                price = float(price)
-            except ValueError:
-                price = None
-            return price, currency
-    
-
-    def _get_size(self):
-        sizeText = self.sizeText
-        if not sizeText:
-            return None, None
-        else:
-            size_split = sizeText.split()
-            size = "".join(size_split[:-1]).replace(",", ".")
-            try:
-                size = float(size)
-            except ValueError:
-                size = None
-            size_unit = size_split[-1]
-            return size, size_unit
-
-    def _get_price_per_square_meter(self):
-        if self.price and self.size:
-            if "m²" not in self.sizeUnit:
-                logging.warning("Size unit is not m², check deal with cardId: {}".format(self.cardId))
-                return None
-            price_per_square_meter = self.price / self.size
-            rounded_price_per_square_meter = round(price_per_square_meter, 2)
-            return rounded_price_per_square_meter
-        else:
+
+def parse_price(price_text):
+    """'123 000 €' -> (123000.0, '€')"""
+    if not price_text:
+        return None, None
+    price_split = price_text.split()
+    return parse_number(price_split[:-1]), price_split[-1]
+
+
+def parse_rent_price(price_text):
+    """'1 200 € / kk' -> (1200.0, '€', 'kk')"""
+    if not price_text:
+        return None, None, None
+    price_split = price_text.split()
+    if len(price_split) < 3:
+        return None, None, None
+    return parse_number(price_split[:-3]), price_split[-3], price_split[-1]
+
+
+def parse_size(size_text):
+    """'54,5 m²' -> (54.5, 'm²')"""
+    if not size_text:
+        return None, None
+    size_split = size_text.split()
+    return parse_number(size_split[:-1]), size_split[-1]
+
+
+def price_per_square_meter(price, size, size_unit, card_id=None):
+    if price and size:
+        if "m²" not in size_unit:
+            logging.warning("Size unit is not m², check deal with cardId: {}".format(card_id))
             return None
-        
+        return round(price / size, 2)
+    else:
+        return None
+
+
+class Record:
+    """Record backed by the dict it is serialised as, `to_dict` returns that dict without copying."""
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __getattr__(self, name):
+        if name == 'fields':
+            raise AttributeError(name)
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def to_dict(self):
+        return self.fields
+
+
+class Company(Record):
+    __slots__ = ()
 
-class Rent:
     def __init__(self, data):
-        self.cardId = data.get('cardId')
-        self.url = data.get('url')
-        self.updatedAt = datetime.now()
-        self.status = data.get('status')
-        self.cardType = data.get('cardType')
-        self.cardSubType = data.get('cardSubType')
-        if data.get('data', {}):
-            self.roomConfiguration = data.get('data', {}).get('roomConfiguration')
-            self.buildYear = data.get('data', {}).get('buildYear')
-            self.priceText = self._decode_text(data.get('data', {}).get('price'))
-            self.price, self.priceCurrency, self.priceCycle = self._get_price()
-            self.sizeText = data.get('data', {}).get('size')
-            self.size, self.sizeUnit = self._get_size()
-            self.revenuePerSquareMeter = self._get_revenue_per_square_meter()
-            self.description = data.get('data', {}).get('description')
-            self.rooms = data.get('data', {}).get('rooms')
-            self.sizeLot = data.get('data', {}).get('sizeLot')
-            self.sizeMin = data.get('data', {}).get('sizeMin')
-            self.sizeMax = data.get('data', {}).get('sizeMax')
-            self.newDevelopment = data.get('data', {}).get('newDevelopment')
-            self.isOnlineOffer = data.get('data', {}).get('isOnlineOffer')
-            self.extraVisibility = data.get('data', {}).get('extraVisibility')
-            self.visits = data.get('data', {}).get('visits')
-            self.visitsWeekly = data.get('data', {}).get('visitsWeekly')
-        if data.get('location', {}):
-            self.district = data.get('location', {}).get('district')
-            self.city = data.get('location', {}).get('city')
-            self.country = data.get('location', {}).get('country')
-            self.address = data.get('location', {}).get('address')
-            self.latitude = data.get('location', {}).get('latitude')
-            self.longitude = data.get('location', {}).get('longitude')
-        if data.get('meta', {}):
-            self.published = str_to_datetime(data.get('meta', {}).get('published'))
-            self.contractType = data.get('meta', {}).get('contractType')
-            self.listingType = data.get('meta', {}).get('listingType')
-            self.sellStatus = data.get('meta', {}).get('sellStatus')
-            self.priceChanged = str_to_datetime(data.get('meta', {}).get('priceChanged'))
-        medias = data.get('medias', [])
-        if medias:
-            self.image1 = medias[0].get('imageLargeJPEG')
-            if len(medias) > 1:
-                self.image2 = medias[1].get('imageLargeJPEG')
-            if len(medias) > 2:
-                self.image3 = medias[2].get('imageLargeJPEG')
-            if len(medias) > 3:
-                self.image4 = medias[3].get('imageLargeJPEG')
-        if data.get('company'):
-            self.companyId = data.get('company', {}).get('companyId')
-
-
-    def _decode_text(self, text):
-        if not text:
-            return None
+        company = data.get('company')
+        if company:
+            super().__init__({
+                'companyId': company.get('companyId'),
+                'name': company.get('companyName'),
+                'logoSmall': company.get('logoSmall'),
+                'updatedAt': datetime.now(),
+            })
         else:
-            text = text.encode("utf-8").decode("utf-8").strip()
-            text = " ".join(text.split())
-            return text
+            super().__init__({})
 
 
-    def _get_price(self):
-        if not self.priceText:
-            return None, None, None
-        else:
-            priceCycle = self.priceText.split()[-1]
-            currency = self.priceText.split()[-3]
-            price = "".join(self.priceText.split()[:-3])
-            try:
-                price = float(price)
-            except ValueError:
-                price = None
-            return price, currency, priceCycle
-    
-
-    def _get_size(self):
-        sizeText = self.sizeText
-        if not sizeText:
-            return None, None
-        else:
-            size_split = sizeText.split()
-            size = "".join(size_split[:-1]).replace(",", ".")
-            try:
-                size = float(size)
-            except ValueError:
-                size = None
-            size_unit = size_split[-1]
-            return size, size_unit
-
-    def _get_revenue_per_square_meter(self):
-        if self.price and self.size:
-            if "m²" not in self.sizeUnit:
-                logging.warning("Size unit is not m², check deal with cardId: {}".format(self.cardId))
-                return None
-            price_per_square_meter = self.price / self.size
-            rounded_price_per_square_meter = round(price_per_square_meter, 2)
-            return rounded_price_per_square_meter
-        else:
-            return None
-        
+# Field mapping shared by every listing type, each card section is read with one lookup
+TOP_FIELDS = ('status', 'cardType', 'cardSubType')
+DATA_FIELDS = ('description', 'rooms', 'sizeLot', 'sizeMin', 'sizeMax', 'newDevelopment', 'isOnlineOffer',
+               'extraVisibility', 'visits', 'visitsWeekly')
+LOCATION_FIELDS = ('district', 'city', 'country', 'address', 'latitude', 'longitude')
+META_FIELDS = (('published', str_to_datetime), ('contractType', None), ('listingType', None),
+               ('sellStatus', None), ('priceChanged', str_to_datetime))
+MEDIA_FIELDS = ('image1', 'image2', 'image3', 'image4')
+
+
+class Listing(Record):
+    """Search card of any listing type, subclasses only define how the price text is parsed."""
+    __slots__ = ()
+    PER_SQUARE_METER_FIELD = None
+
+    def _set_price(self, fields, price_text):
+        raise NotImplementedError
 
-class CardDetails:
     def __init__(self, data):
-        self.fullAddress = data.get('fullAddress')
-        self.postalCode = data.get('postalCode')
-        self.upcomingRenovations = data.get('upcomingRenovations')
-        self.doneRenovations = data.get('doneRenovations')
-        self.conditionType = data.get('conditionType')
-        self.housingType = data.get('housingType')
-        self.landOwnership = data.get('landOwnership')
-        self.debtFreePriceText = data.get('debtFreePriceText')
-        self.sellingPriceText = data.get('sellingPriceText')
-        self.pricePerSquareMeterText = data.get('pricePerSquareMeterText')
-        self.debtShareText = data.get('debtShareText')
-        self.treatmentFeeText = data.get('treatmentFeeText')
-        self.capitalConsidersationText = data.get('capitalConsidersationText')
-        self.totalCompanyConsidersationText = data.get('totalCompanyConsidersationText')
-        self.waterFeeText = data.get('waterFeeText')
-        self.saunaCostsText = data.get('saunaCostsText')
-        self.waterCostsAdditionalText = data.get('waterCostsAdditionalText')
-        self.otherCostsText = data.get('otherCostsText')
+        fields = {'cardId': data.get('cardId'), 'url': data.get('url'), 'updatedAt': datetime.now()}
+        for name in TOP_FIELDS:
+            fields[name] = data.get(name)
+
+        card_data = data.get('data')
+        if card_data:
+            fields['roomConfiguration'] = card_data.get('roomConfiguration')
+            fields['buildYear'] = card_data.get('buildYear')
+            price_text = fields['priceText'] = decode_text(card_data.get('price'))
+            self._set_price(fields, price_text)
+            size_text = fields['sizeText'] = card_data.get('size')
+            size, size_unit = fields['size'], fields['sizeUnit'] = parse_size(size_text)
+            fields[self.PER_SQUARE_METER_FIELD] = price_per_square_meter(fields['price'], size, size_unit,
+                                                                         fields['cardId'])
+            for name in DATA_FIELDS:
+                fields[name] = card_data.get(name)
+
+        location = data.get('location')
+        if location:
+            for name in LOCATION_FIELDS:
+                fields[name] = location.get(name)
+
+        meta = data.get('meta')
+        if meta:
+            for name, convert in META_FIELDS:
+                value = meta.get(name)
+                fields[name] = convert(value) if convert else value
+
+        for name, media in zip(MEDIA_FIELDS, data.get('medias') or ()):
+            fields[name] = media.get('imageLargeJPEG')
 
+        company = data.get('company')
+        if company:
+            fields['companyId'] = company.get('companyId')
+        super().__init__(fields)
+
+
+class Deal(Listing):
+    __slots__ = ()
+    PER_SQUARE_METER_FIELD = 'pricePerSquareMeter'
+
+    def _set_price(self, fields, price_text):
+        fields['price'], fields['priceCurrency'] = parse_price(price_text)
+
+
+class Rent(Listing):
+    __slots__ = ()
+    PER_SQUARE_METER_FIELD = 'revenuePerSquareMeter'
+
+    def _set_price(self, fields, price_text):
+        fields['price'], fields['priceCurrency'], fields['priceCycle'] = parse_rent_price(price_text)
+
+
+CARD_DETAILS_FIELDS = (
+    'fullAddress', 'postalCode', 'upcomingRenovations', 'doneRenovations', 'conditionType', 'housingType',
+    'landOwnership', 'debtFreePriceText', 'sellingPriceText', 'pricePerSquareMeterText', 'debtShareText',
+    'treatmentFeeText', 'capitalConsidersationText', 'totalCompanyConsidersationText', 'waterFeeText',
+    'saunaCostsText', 'waterCostsAdditionalText', 'otherCostsText',
+)
+
+
+class CardDetails(Record):
+    __slots__ = ()
+
+    def __init__(self, data):
+        super().__init__({name: data.get(name) for name in CARD_DETAILS_FIELDS})
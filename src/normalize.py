@@ -0,0 +1,134 @@
+import re
+from apify import Actor
+
+from src.models import CARD_DETAILS_FIELDS
+from src.stats import run_stats
+
+try:
+    import pyarrow
+    import pyarrow.compute
+except ImportError:
+    pyarrow = None
+
+# Money amounts of the detail page, e.g. '1 234,50 € / kk', '185 000 €' or '3 250 €/m²'
+MONEY_TEXT_FIELDS = tuple(field for field in CARD_DETAILS_FIELDS
+                          if field.endswith('Text') and field != 'waterCostsAdditionalText')
+MONEY_PATTERN = r'(?i)^\s*(?P<amount>[-+]?\d[\d ]*(?:[,.]\d+)?)\s*(?P<currency>€|eur|e)?\s*(?:/\s*(?P<period>\S.*?))?\s*$'
+MONEY_RE = re.compile(MONEY_PATTERN)
+SPACES = {'\xa0': ' ', '\u202f': ' '}  # Non-breaking thousands separators
+PERIODS = {'kk': 'month', 'kuukausi': 'month', 'kuukaudessa': 'month', 'v': 'year', 'vuosi': 'year',
+           'vuodessa': 'year', 'hlö': 'person', 'henkilö': 'person', 'm2': 'm²', 'm²': 'm²'}
+MAX_EXAMPLES = 5
+
+
+def normalized_names(field):
+    """Amount, currency and period column names of a text field, `debtFreePriceText` -> `debtFreePriceAmount`..."""
+    base = field[:-len('Text')]
+    return f'{base}Amount', f'{base}Currency', f'{base}Period'
+
+
+NORMALIZED_COLUMNS = tuple((name, column_type) for field in MONEY_TEXT_FIELDS
+                           for name, column_type in zip(normalized_names(field), ('float64', 'string', 'string')))
+
+
+def _period(text):
+    if not text:
+        return None
+    return '/'.join(PERIODS.get(part.strip().lower(), part.strip()) for part in text.split('/'))
+
+
+class UnparsedValues:
+    """Texts that are not a money amount, counted per field with a few examples of each."""
+
+    def __init__(self):
+        self.counts = {}
+        self.examples = {}
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def add(self, field, texts):
+        if not texts:
+            return
+        self.counts[field] = self.counts.get(field, 0) + len(texts)
+        examples = self.examples.setdefault(field, [])
+        for text in texts:
+            if len(examples) >= MAX_EXAMPLES:
+                break
+            if text not in examples:
+                examples.append(text)
+        run_stats.increment('unparsed_values', len(texts), field=field)
+
+    def log(self, label='CardDetails'):
+        for field, count in sorted(self.counts.items()):
+            Actor.log.warning(f"{count} {label} {field} values are not amounts, e.g. {self.examples[field]}")
+
+
+def _normalize_arrow(texts):
+    compute = pyarrow.compute
+    texts = pyarrow.array(texts, pyarrow.string())
+    cleaned = texts
+    for space, replacement in SPACES.items():
+        cleaned = compute.replace_substring(cleaned, space, replacement)
+    parts = compute.extract_regex(cleaned, MONEY_PATTERN)  # Null where the whole text is not an amount
+    amounts = compute.replace_substring(compute.struct_field(parts, 'amount'), ' ', '')
+    amounts = compute.cast(compute.replace_substring(amounts, ',', '.'), pyarrow.float64())
+    currencies = compute.if_else(compute.greater(compute.utf8_length(compute.struct_field(parts, 'currency')), 0),
+                                 pyarrow.scalar('EUR'), pyarrow.scalar(None, pyarrow.string()))
+    # Units are few distinct values, so they are mapped once per dictionary entry
+    periods = compute.struct_field(parts, 'period').dictionary_encode()
+    periods = compute.take(pyarrow.array([_period(unit) for unit in periods.dictionary.to_pylist()],
+                                         pyarrow.string()), periods.indices)
+    failed = compute.and_(compute.is_null(parts),
+                          compute.not_equal(compute.utf8_trim_whitespace(cleaned), ''))
+    return amounts, currencies, periods, compute.filter(texts, failed).to_pylist()
+
+
+def _normalize_python(texts):
+    amounts, currencies, periods, unparsed = [], [], [], []
+    for text in texts:
+        match = None
+        if text is not None:
+            cleaned = str(text)
+            for space, replacement in SPACES.items():
+                cleaned = cleaned.replace(space, replacement)
+            match = MONEY_RE.match(cleaned)
+            if match is None and cleaned.strip():
+                unparsed.append(text)
+        if match is None:
+            amounts.append(None)
+            currencies.append(None)
+            periods.append(None)
+            continue
+        amounts.append(float(match['amount'].replace(' ', '').replace(',', '.')))
+        currencies.append('EUR' if match['currency'] else None)
+        periods.append(_period(match['period']))
+    return amounts, currencies, periods, unparsed
+
+
+def normalize_columns(columns, fields=MONEY_TEXT_FIELDS, unparsed=None):
+    """Typed amount, currency and period columns of the money text `fields` of a batch.
+
+    `columns` maps field names to equally long sequences of texts, e.g. a dict of lists or a pandas DataFrame.
+    With pyarrow installed, each field is converted as a whole with Arrow compute kernels and the columns are
+    Arrow arrays, otherwise texts are matched one by one into lists. Texts that are not amounts become None
+    and are counted in `unparsed`.
+    """
+    normalize = _normalize_arrow if pyarrow is not None else _normalize_python
+    result = {}
+    for field in fields:
+        if field not in columns:
+            continue
+        amounts, currencies, periods, failed = normalize(list(columns[field]))
+        for name, values in zip(normalized_names(field), (amounts, currencies, periods)):
+            result[name] = values
+        if unparsed is not None:
+            unparsed.add(field, failed)
+    return result
+
+
+def normalize_records(records, fields=MONEY_TEXT_FIELDS, unparsed=None):
+    """`normalize_columns` of a list of record dicts."""
+    return normalize_columns({field: [record.get(field) for record in records] for field in fields},
+                             fields, unparsed)
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from apify import Actor
+
+
+# (section title, row title) -> CardDetails field
+DETAIL_FIELDS = {
+    # Basic details
+    ('Perustiedot', 'Tulevat remontit'): 'upcomingRenovations',
+    ('Perustiedot', 'Tehdyt remontit'): 'doneRenovations',
+    ('Perustiedot', 'Kunto'): 'conditionType',
+    ('Perustiedot', 'Asumistyyppi'): 'housingType',
+    # Lot and house
+    ('Talon ja tontin tiedot', 'Tontin omistus'): 'landOwnership',
+    # Price
+    ('Hinta', 'Velaton hinta'): 'debtFreePriceText',
+    ('Hinta', 'Myyntihinta'): 'sellingPriceText',
+    ('Hinta', 'Neliöhinta'): 'pricePerSquareMeterText',
+    ('Hinta', 'Velkaosuus'): 'debtShareText',
+    # Considersation
+    ('Vastikkeet', 'Hoitovastike'): 'treatmentFeeText',
+    ('Vastikkeet', 'Pääomavastike'): 'capitalConsidersationText',
+    ('Vastikkeet', 'Yhtiövastike yhteensä'): 'totalCompanyConsidersationText',
+    # Other payments
+    ('Muut maksut', 'Vesimaksu'): 'waterFeeText',
+    ('Muut maksut', 'Saunan kustannukset'): 'saunaCostsText',
+    ('Muut maksut', 'Vesimaksun lisätiedot'): 'waterCostsAdditionalText',
+    ('Muut maksut', 'Muut kustannukset'): 'otherCostsText',
+}
+DETAIL_SECTIONS = {section for section, _ in DETAIL_FIELDS}
+
+
+def _selectolax_extract(html):
+    from selectolax.parser import HTMLParser
+
+    tree = HTMLParser(html)
+    breadcrumbs = tree.css_first('div.breadcrumbs')
+    full_address = None
+    if breadcrumbs:
+        items = breadcrumbs.css('span.breadcrumbs__item')
+        full_address = items[-1].text() if items else ''
+
+    rows = []
+    for section in tree.css('div.listing-details-container div.listing-details'):
+        section_title = section.css_first('h3.listing-details__title')
+        if not section_title:
+            continue
+        section_title = section_title.text().strip()
+        if section_title not in DETAIL_SECTIONS:
+            continue
+        for row in section.css('div.info-table__row'):
+            title = row.css_first('dt.info-table__title')
+            value = row.css_first('dd.info-table__value')
+            if title and value:
+                rows.append((section_title, title.text(), value.text()))
+    return breadcrumbs is not None, full_address, rows
+
+
+def _soup_extract(html, features):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, features)
+    breadcrumbs = soup.find('div', {'class': 'breadcrumbs'})
+    full_address = None
+    if breadcrumbs:
+        items = breadcrumbs.find_all('span', {'class': 'breadcrumbs__item'})
+        full_address = items[-1].text if items else ''
+
+    rows = []
+    listing_details_container = soup.find('div', {'class': 'listing-details-container'})
+    sections = listing_details_container.find_all('div', {'class': 'listing-details'}) if listing_details_container else []
+    for section in sections:
+        section_title = section.find('h3', {'class': 'listing-details__title'})
+        if not section_title:
+            continue
+        section_title = section_title.text.strip()
+        if section_title not in DETAIL_SECTIONS:
+            continue
+        for row in section.find_all('div', {'class': 'info-table__row'}):
+            title = row.find('dt', {'class': 'info-table__title'})
+            value = row.find('dd', {'class': 'info-table__value'})
+            if title and value:
+                rows.append((section_title, title.text, value.text))
+    return breadcrumbs is not None, full_address, rows
+
+
+PARSER_BACKENDS = {
+    'selectolax': _selectolax_extract,
+    'lxml': lambda html: _soup_extract(html, 'lxml'),
+    'html.parser': lambda html: _soup_extract(html, 'html.parser'),
+}
+
+
+def _backend_available(name):
+    try:
+        if name == 'selectolax':
+            import selectolax.parser  # noqa: F401
+        elif name == 'lxml':
+            import lxml  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_parser_backend():
+    for name in ('selectolax', 'lxml'):
+        if _backend_available(name):
+            return name
+    return 'html.parser'
+
+
+parser_backend = None
+
+
+def set_parser_backend(name=None):
+    """Select the HTML parser backend, falls back to the fastest installed one."""
+    global parser_backend
+    if name and name not in PARSER_BACKENDS:
+        Actor.log.error(f"Unknown parser backend {name}, using the default")
+        name = None
+    if name and not _backend_available(name):
+        Actor.log.warning(f"Parser backend {name} is not installed, using the default")
+        name = None
+    parser_backend = name or default_parser_backend()
+    Actor.log.info(f"Using parser backend: {parser_backend}")
+
+
+def clean_value_text(value):
+    return value.replace('\xa0', ' ').strip() if value else None
+
+
+def parse_card_details(html, url=None, backend=None) -> dict:
+    """Parse the listing detail page into a dict of `CardDetails` fields in one pass over the info-table rows."""
+    if backend is None:
+        if parser_backend is None:
+            set_parser_backend()
+        backend = parser_backend
+    has_breadcrumbs, full_address, rows = PARSER_BACKENDS[backend](html)
+
+    result = {}
+    if has_breadcrumbs:
+        postal_code = None
+        try:
+            full_address = full_address.strip()
+            postal_code = full_address.split(',')[-1].strip()
+            postal_code = re.search(r'\d+', postal_code).group()
+        except Exception as e:
+            full_address = -1
+            Actor.log.error(f"Error at url {url}: {e}")
+        result['fullAddress'] = full_address
+        result['postalCode'] = postal_code
+
+    for section_title, title, value in rows:
+        field = DETAIL_FIELDS.get((section_title, title.strip()))
+        if field:
+            result[field] = clean_value_text(value)
+    return result
+
+
+parse_executor = None
+
+
+def set_parse_executor(kind=None, max_workers=None):
+    """Run detail page parsing in a `process` or `thread` pool instead of on the event loop."""
+    global parse_executor
+    shutdown_parse_executor()
+    if not kind or kind == 'none':
+        return
+    max_workers = max_workers or os.cpu_count() or 1
+    if kind == 'process':
+        parse_executor = ProcessPoolExecutor(max_workers=max_workers)
+    elif kind == 'thread':
+        parse_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='parser')
+    else:
+        Actor.log.error(f"Unknown parse executor {kind}, parsing on the event loop")
+        return
+    Actor.log.info(f"Parsing detail pages in a {kind} pool with {max_workers} workers")
+
+
+def shutdown_parse_executor():
+    global parse_executor
+    if parse_executor:
+        parse_executor.shutdown(cancel_futures=True)
+        parse_executor = None
+
+
+async def parse_card_details_async(html, url=None) -> dict:
+    """Parse on the configured executor, the html and the returned dict are the only data crossing the pool."""
+    if parser_backend is None:
+        set_parser_backend()
+    if parse_executor is None:
+        return parse_card_details(html, url, parser_backend)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(parse_executor, parse_card_details, html, url, parser_backend)
@@ -0,0 +1,53 @@
+import asyncio
+import itertools
+from apify import Actor
+
+
+class DetailPipeline:
+    """Bounded queue drained by a pool of detail workers.
+
+    `put` blocks while the queue is full, so the search generator slows down to the pace of the workers.
+    With a `priority` function of the item, queued items are handled highest priority first, so the queue
+    size is the window over which items are reordered.
+    """
+
+    def __init__(self, handler, num_workers=1, queue_size=None, priority=None):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.priority = priority
+        queue_class = asyncio.PriorityQueue if priority else asyncio.Queue
+        self.queue = queue_class(maxsize=queue_size or self.num_workers * 4)
+        self.workers = []
+        self._sequence = itertools.count()  # Keeps equal priorities in arrival order
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            if self.priority:
+                item = item[-1]
+            try:
+                await self.handler(*item)
+            except Exception as e:
+                Actor.log.error(f"Detail worker failed: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    async def put(self, *item):
+        if self.priority:
+            await self.queue.put((-self.priority(*item), next(self._sequence), item))
+        else:
+            await self.queue.put(item)
+
+    async def __aenter__(self):
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.queue.join()
+        finally:
+            for worker in self.workers:
+                worker.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+            self.workers = []
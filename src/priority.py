@@ -0,0 +1,72 @@
+import math
+
+from src.changes import CHANGE_FIELDS
+from src.detail_cache import card_fingerprint
+
+DEFAULT_PRIORITY_WEIGHTS = {'new': 100.0, 'changed': 50.0, 'skipped': 150.0, 'newDevelopment': 10.0,
+                            'visitsWeekly': 5.0}
+
+
+class DetailPriority:
+    """Ranks search cards for detail fetching from signals already on the card.
+
+    Cards missing from both the detail cache and the change tracker state are new, cards whose `priceChanged`,
+    `published` or `status` differ from the cached ones or whose price differs from the tracked one have
+    changed. Popular listings (`visitsWeekly`, on a log scale) and new developments rank higher on top, and so
+    do the `skipped` cards a previous run ranked high but had no detail budget left for.
+    """
+
+    def __init__(self, detail_cache=None, change_tracker=None, weights=None, skipped=()):
+        self.detail_cache = detail_cache
+        self.change_tracker = change_tracker
+        self.skipped = set(skipped)
+        self.weights = {**DEFAULT_PRIORITY_WEIGHTS, **(weights or {})}
+
+    def _history(self, card_id):
+        cached = self.detail_cache.entries.get(card_id) if self.detail_cache else None
+        tracked = self.change_tracker.cards.get(card_id) if self.change_tracker else None
+        return cached, tracked
+
+    def score(self, card):
+        card_id = str(card.get('cardId'))
+        cached, tracked = self._history(card_id)
+        score = 0.0
+        if (self.detail_cache or self.change_tracker) and cached is None and tracked is None:
+            score += self.weights['new']
+        elif (cached is not None and cached[0] != card_fingerprint(card)) or \
+                (tracked is not None and tracked[1] != card.get(CHANGE_FIELDS[0])):
+            score += self.weights['changed']
+        if card_id in self.skipped:
+            score += self.weights['skipped']
+        if card.get('newDevelopment'):
+            score += self.weights['newDevelopment']
+        try:
+            score += self.weights['visitsWeekly'] * math.log1p(max(0, int(card.get('visitsWeekly') or 0)))
+        except (TypeError, ValueError):
+            pass
+        return score
+
+    def __call__(self, card, *detail_args):
+        """Priority of a `DetailPipeline` item."""
+        return self.score(card)
+
+
+class RequestBudget:
+    """Number of detail requests a run may make, shared by all markets. A limit of None is unlimited."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.spent = 0
+        self.skipped = 0
+
+    @property
+    def exhausted(self):
+        return self.limit is not None and self.spent >= self.limit
+
+    def take(self):
+        """Spend one request, returns False and counts the skip once the budget is used up."""
+        if self.exhausted:
+            self.skipped += 1
+            return False
+        self.spent += 1
+        return True
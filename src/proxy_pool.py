@@ -0,0 +1,144 @@
+import random
+import statistics
+import time
+from urllib.parse import quote, unquote, urlsplit
+
+
+def build_proxy_urls(servers, username, password, sessions=0, session_template='{username}-session-{session}'):
+    """Proxy URLs for every server in the comma separated `servers`, with `sessions` session-suffixed
+    usernames per server when given."""
+    usernames = [session_template.format(username=username, session=session) for session in range(sessions)] \
+        if sessions else [username]
+    return [f"http://{quote(name, safe='')}:{quote(password, safe='')}@{server.strip()}"
+            for server in servers.split(',') if server.strip() for name in usernames]
+
+
+def playwright_proxy(proxy_url):
+    """`setup_api_headers` proxy arguments of a proxy URL."""
+    split = urlsplit(proxy_url)
+    return {
+        'proxy_server': f"{split.hostname}:{split.port}",
+        'proxy_username': unquote(split.username or ''),
+        'proxy_password': unquote(split.password or ''),
+    }
+
+
+def proxy_key(proxy_url):
+    """Credential-free name of a proxy, `username@host:port`, safe to persist and log."""
+    split = urlsplit(proxy_url)
+    return f"{unquote(split.username or '')}@{split.hostname}:{split.port}"
+
+
+def _token(api_headers):
+    return api_headers.get('ota-token') if api_headers else None
+
+
+class ProxyStats:
+    __slots__ = ('latency', 'error_rate', 'requests', 'cooldown_until')
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.cooldown_until = 0.0
+
+
+class ProxyPool:
+    """Proxy endpoints scored by the moving average of their latency and error rate.
+
+    Requests without a header set go to the better of two random healthy proxies. Header sets are pinned to
+    the proxy they were minted on, since a token used from another exit is likely to be rejected. A proxy
+    whose error rate goes over `max_error_rate` or whose latency goes over `max_latency` is degraded for
+    `cooldown` seconds: it gets no new requests and its header sets are skipped and re-minted elsewhere.
+    """
+
+    def __init__(self, proxy_urls, smoothing=0.2, max_error_rate=0.3, max_latency=10.0, cooldown=120.0,
+                 min_requests=5):
+        self.proxy_urls = list(proxy_urls)
+        self.smoothing = smoothing
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.cooldown = cooldown
+        self.min_requests = min_requests
+        self.stats = {proxy_url: ProxyStats() for proxy_url in self.proxy_urls}
+        self.urls = {proxy_key(proxy_url): proxy_url for proxy_url in self.proxy_urls}
+        self.pins = {}
+
+    def __len__(self):
+        return len(self.proxy_urls)
+
+    def url(self, key):
+        """Proxy URL of a `proxy_key`, None when that proxy is not in the pool."""
+        return self.urls.get(key)
+
+    def is_degraded(self, proxy_url):
+        stats = self.stats.get(proxy_url)
+        return stats is not None and stats.cooldown_until > time.monotonic()
+
+    def score(self, proxy_url):
+        """Lower is better, proxies without measurements score 0 so they are tried first."""
+        stats = self.stats[proxy_url]
+        return (stats.latency or 0.0) * (1 + 4 * stats.error_rate)
+
+    def healthy(self):
+        return [proxy_url for proxy_url in self.proxy_urls if not self.is_degraded(proxy_url)]
+
+    def choose(self):
+        candidates = self.healthy() or self.proxy_urls
+        if len(candidates) == 1:
+            return candidates[0]
+        return min(random.sample(candidates, 2), key=self.score)
+
+    def pin(self, api_headers, proxy_url):
+        if _token(api_headers) and proxy_url in self.stats:
+            self.pins[_token(api_headers)] = proxy_url
+
+    def select(self, api_headers=None):
+        """Proxy for a request: the pinned proxy of the header set, or the best healthy one."""
+        return self.pins.get(_token(api_headers)) or self.choose()
+
+    def headers_usable(self, api_headers):
+        return not self.is_degraded(self.pins.get(_token(api_headers)))
+
+    def record(self, proxy_url, latency, status_code=None):
+        """Update the proxy's score from one response, `status_code` is None for a failed request."""
+        stats = self.stats.get(proxy_url)
+        if stats is None:
+            return
+        ok = status_code is not None and (status_code < 400 or status_code in (404, 410))
+        stats.requests += 1
+        stats.error_rate += self.smoothing * ((0.0 if ok else 1.0) - stats.error_rate)
+        if ok:
+            stats.latency = latency if stats.latency is None else \
+                stats.latency + self.smoothing * (latency - stats.latency)
+        degraded = stats.error_rate > self.max_error_rate or (stats.latency or 0.0) > self.max_latency
+        if degraded and stats.requests >= self.min_requests and not self.is_degraded(proxy_url):
+            stats.cooldown_until = time.monotonic() + self.cooldown
+            # Back on probation after the cooldown, a few more errors degrade it again
+            stats.error_rate = self.max_error_rate / 2
+            stats.latency = min(stats.latency or 0.0, self.max_latency / 2) or None
+
+    def summary(self):
+        latencies = [stats.latency for stats in self.stats.values() if stats.latency is not None]
+        return {
+            'proxies': len(self.proxy_urls),
+            'degraded': len(self.proxy_urls) - len(self.healthy()),
+            'medianLatency': round(statistics.median(latencies), 3) if latencies else None,
+        }
+
+
+def resolve_proxy(proxy, api_headers=None):
+    """Proxy URL of a request, `proxy` is a proxy URL, a `ProxyPool` or None."""
+    if isinstance(proxy, ProxyPool):
+        return proxy.select(api_headers)
+    return proxy
+
+
+def record_proxy(proxy, proxy_url, latency, status_code=None):
+    if isinstance(proxy, ProxyPool):
+        proxy.record(proxy_url, latency, status_code)
+
+
+def headers_usable(proxy, api_headers):
+    """Whether a header set's pinned proxy is healthy, always True without a `ProxyPool`."""
+    return not isinstance(proxy, ProxyPool) or proxy.headers_usable(api_headers)
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from src.proxy_pool import proxy_key
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff for the given zero-based retry attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def rate_identity(proxy_url=None, api_headers=None):
+    """Identity a request is rate limited under: the proxy exit and the `ota-token`. It also labels the run
+    statistics, so it is an opaque digest that does not reveal the proxy username or the token."""
+    parts = []
+    if proxy_url:
+        parts.append(proxy_key(proxy_url))
+    token = api_headers.get('ota-token') if api_headers else None
+    if token:
+        parts.append(token)
+    if not parts:
+        return 'direct'
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateController:
+    """Token bucket per header or proxy identity with AIMD rate adjustment.
+
+    Every successful, fast response adds `increase` requests/second to the identity's rate (a twentieth of the
+    initial rate by default). Errors, 429 and 5xx responses multiply it by `decrease`, slow responses by
+    `slow_decrease`, and `Retry-After` pauses the identity's bucket.
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.05, max_rate=10.0, increase=None,
+                 decrease=0.5, slow_decrease=0.9, target_latency=5.0, burst=1.0):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase or max(0.05, initial_rate / 20)
+        self.decrease = decrease
+        self.slow_decrease = slow_decrease
+        self.target_latency = target_latency
+        self.burst = burst
+        self.buckets = {}
+
+    def _bucket(self, identity):
+        bucket = self.buckets.get(identity)
+        if bucket is None:
+            bucket = self.buckets[identity] = TokenBucket(self.initial_rate, self.burst)
+        return bucket
+
+    async def acquire(self, identity=None):
+        await self._bucket(identity).acquire()
+
+    def record(self, identity, latency, status_code=None, retry_after=None):
+        """Adjust the identity's rate from one response, `status_code` is None for a failed request."""
+        bucket = self._bucket(identity)
+        if status_code is None or status_code == 429 or status_code >= 500:
+            bucket.rate *= self.decrease
+            pause = parse_retry_after(retry_after)
+            if pause:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + pause)
+        elif latency > self.target_latency:
+            bucket.rate *= self.slow_decrease
+        else:
+            bucket.rate += self.increase
+        bucket.rate = min(self.max_rate, max(self.min_rate, bucket.rate))
+
+    def current_rates(self):
+        """Current requests/second by identity."""
+        return {identity: round(bucket.rate, 3) for identity, bucket in self.buckets.items()}
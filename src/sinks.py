@@ -0,0 +1,116 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from apify import Actor
+
+from src.stats import run_stats
+
+
+class BufferedStoreWriter:
+    """Write-behind buffer in front of a key-value store or dataset.
+
+    Records are flushed in bulk when `max_records` are buffered or `max_delay` seconds have passed since the
+    last flush, and on close. A key-value store batch is written with up to `concurrency` concurrent
+    `set_value` calls, a dataset batch with one `push_data` call. Records stay buffered until their write
+    succeeds, so a failed flush is retried by the next one.
+    """
+
+    def __init__(self, storage, max_records=500, max_delay=10.0, concurrency=16):
+        self.storage = storage
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self.buffer = {}
+        self.written = 0
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._flusher = None
+        self._closing = asyncio.Event()
+
+    async def write(self, key, record):
+        """Buffer a record, a later record with the same key replaces the earlier one."""
+        self.buffer[key] = record
+        if len(self.buffer) >= self.max_records:
+            await self.flush()
+
+    def _drop_written(self, batch, keys):
+        for key in keys:
+            if self.buffer.get(key) is batch[key]:  # Not replaced by a newer record while writing
+                del self.buffer[key]
+
+    async def flush(self):
+        async with self._lock:
+            self._last_flush = time.monotonic()
+            if not self.buffer:
+                return
+            batch = dict(self.buffer)
+            started = time.perf_counter()
+            errors = []
+            if hasattr(self.storage, 'push_data'):
+                await self.storage.push_data(list(batch.values()))
+                written = list(batch)
+            else:
+                semaphore = asyncio.Semaphore(self.concurrency)
+
+                async def set_value(key, record):
+                    async with semaphore:
+                        await self.storage.set_value(key, record)
+
+                results = await asyncio.gather(*[set_value(key, record) for key, record in batch.items()],
+                                               return_exceptions=True)
+                written = [key for key, result in zip(batch, results) if not isinstance(result, BaseException)]
+                errors = [result for result in results if isinstance(result, BaseException)]
+            self._drop_written(batch, written)
+            run_stats.observe('storage_write', time.perf_counter() - started)
+            run_stats.increment('records_written', len(written))
+            self.written += len(written)
+            if errors:
+                raise errors[0]
+
+    async def _flush_periodically(self):
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.max_delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() - self._last_flush >= self.max_delay:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    Actor.log.error(f"Failed to flush buffered records: {e}", exc_info=True)
+
+    async def __aenter__(self):
+        self._closing.clear()
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._closing.set()  # A flush in progress finishes instead of being cancelled with its batch
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+
+
+class TeeWriter:
+    """Passes every record to each of `writers`, e.g. several export formats fed from one stream."""
+
+    def __init__(self, *writers):
+        self.writers = writers
+        self._stack = None
+
+    async def write(self, key, record):
+        for writer in self.writers:
+            await writer.write(key, record)
+
+    async def flush(self):
+        for writer in self.writers:
+            await writer.flush()
+
+    async def __aenter__(self):
+        self._stack = AsyncExitStack()
+        for writer in self.writers:
+            await self._stack.enter_async_context(writer)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stack.__aexit__(*exc_info)
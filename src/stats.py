@@ -0,0 +1,171 @@
+import asyncio
+import statistics
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from apify import Actor
+
+
+class StageStats:
+    """Call count and total time of one stage, with a rolling window of recent durations for percentiles."""
+    __slots__ = ('count', 'total', 'max', 'recent')
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, share):
+        if not self.recent:
+            return None
+        if len(self.recent) == 1:
+            return self.recent[0]
+        return statistics.quantiles(self.recent, n=100, method='inclusive')[int(share * 100) - 1]
+
+    def summary(self):
+        p50, p95 = self.percentile(0.50), self.percentile(0.95)
+        return {
+            'count': self.count,
+            'totalSeconds': round(self.total, 3),
+            'meanMs': round(self.total * 1000 / self.count, 2) if self.count else None,
+            'p50Ms': round(p50 * 1000, 2) if p50 is not None else None,
+            'p95Ms': round(p95 * 1000, 2) if p95 is not None else None,
+            'maxMs': round(self.max * 1000, 2),
+        }
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class RunStats:
+    """Timers per crawl stage and labelled counters for one run.
+
+    Stages are timed with `timer`, e.g. `search_request`, `detail_request`, `parse`, `model_build` and
+    `storage_write`. Counters such as responses by status code or bytes transferred are labelled by the
+    header or proxy identity they were made under.
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.started = time.time()
+        self.stages = {}
+        self.counters = Counter()
+
+    def observe(self, stage, seconds):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats(self.window)
+        stats.add(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def increment(self, name, value=1, **labels):
+        self.counters[name, tuple(sorted(labels.items()))] += value
+
+    def record_response(self, kind, identity, status_code=None, num_bytes=0):
+        """Count one `search` or `detail` response, `status_code` is None for a failed request."""
+        self.increment(f'{kind}_responses', identity=identity, status=status_code or 'error')
+        if num_bytes:
+            self.increment(f'{kind}_bytes', num_bytes, identity=identity)
+
+    def snapshot(self):
+        counters = {}
+        for (name, labels), value in self.counters.items():
+            counters.setdefault(name, []).append({**dict(labels), 'value': value})
+        return {
+            'startedAt': self.started,
+            'updatedAt': time.time(),
+            'elapsedSeconds': round(time.time() - self.started, 3),
+            'stages': {stage: stats.summary() for stage, stats in self.stages.items()},
+            'counters': counters,
+        }
+
+    def prometheus(self, prefix='oikotie'):
+        """The current statistics in the Prometheus text exposition format."""
+        lines = [f'# TYPE {prefix}_stage_seconds summary']
+        for stage, stats in self.stages.items():
+            for share in (0.5, 0.95):
+                value = stats.percentile(share)
+                if value is not None:
+                    lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{share}"}} {value:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats.total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats.count}')
+        names = sorted({name for name, _ in self.counters})
+        for name in names:
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for (counter, labels), value in self.counters.items():
+                if counter == name:
+                    lines.append(f'{prefix}_{name}_total{_label_text(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    async def save(self, store, key='RUN_STATS'):
+        await store.set_value(key, self.snapshot())
+
+    @asynccontextmanager
+    async def autosave(self, store, key='RUN_STATS', interval=30):
+        """Save a rolling summary every `interval` seconds and the final one on exit."""
+        async def save_periodically():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.save(store, key)
+                except Exception as e:
+                    Actor.log.error(f"Failed to save run statistics: {e}", exc_info=True)
+
+        task = asyncio.create_task(save_periodically())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await self.save(store, key)
+
+    async def _handle_scrape(self, reader, writer):
+        try:
+            while (await reader.readline()).strip():  # Any path returns the metrics
+                pass
+            body = self.prometheus().encode('utf-8')
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                         b'Connection: close\r\n\r\n' + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @asynccontextmanager
+    async def serve(self, port=None, host='127.0.0.1'):
+        """Serve the Prometheus text format on `port`, does nothing when `port` is not set. Only local scrapers
+        reach it unless `host` is set to e.g. `0.0.0.0`."""
+        if not port:
+            yield None
+            return
+        server = await asyncio.start_server(self._handle_scrape, host, port)
+        Actor.log.info(f"Serving run statistics on http://{host}:{port}/metrics")
+        try:
+            yield server
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+run_stats = RunStats()
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+
+class Watermark:
+    """Newest `published` timestamp and recently seen cardIds from the previous run.
+
+    Search results are sorted by `published_sort_desc`, so once `margin_pages` consecutive pages contain
+    only known cards the rest of the catalogue has already been crawled.
+    """
+
+    def __init__(self, published=None, card_ids=(), margin_pages=2, max_card_ids=5000):
+        self.published = published
+        self.card_ids = set(card_ids)
+        self.margin_pages = margin_pages
+        self.max_card_ids = max_card_ids
+        self.pages_past = 0
+        self._old_card_ids = list(card_ids)
+        self._next_published = published
+        self._next_card_ids = []
+
+    @classmethod
+    async def load(cls, store, key, margin_pages=2, max_card_ids=5000):
+        value = await store.get_value(key) or {}
+        published = value.get('published')
+        return cls(published=datetime.fromisoformat(published) if published else None,
+                   card_ids=value.get('cardIds', []),
+                   margin_pages=margin_pages,
+                   max_card_ids=max_card_ids)
+
+    async def save(self, store, key):
+        card_ids = list(dict.fromkeys(self._next_card_ids + self._old_card_ids))[:self.max_card_ids]
+        await store.set_value(key, {
+            'published': self._next_published.isoformat() if self._next_published else None,
+            'cardIds': card_ids,
+        })
+
+    def is_known(self, card):
+        if card.get('cardId') in self.card_ids:
+            return True
+        published = card.get('published')
+        return bool(published and self.published and published <= self.published)
+
+    def observe(self, cards):
+        """Record a batch of cards, returns True once paging has moved `margin_pages` past the watermark."""
+        known = 0
+        for card in cards:
+            published = card.get('published')
+            if published and (self._next_published is None or published > self._next_published):
+                self._next_published = published
+            if len(self._next_card_ids) < self.max_card_ids:
+                self._next_card_ids.append(card.get('cardId'))
+            if self.is_known(card):
+                known += 1
+        if cards and known == len(cards):
+            self.pages_past += 1
+        else:
+            self.pages_past = 0
+        return self.pages_past >= self.margin_pages
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timezone
+from apify import Actor
+
+from src.rate_limiter import backoff_delay
+
+
+class WorkItem:
+    """Leased queue item, `handle` is whatever the backend needs to complete or release it."""
+    __slots__ = ('key', 'payload', 'attempts', 'handle')
+
+    def __init__(self, key, payload, attempts=0, handle=None):
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.handle = handle
+
+
+class SqliteWorkQueue:
+    """Work queue in a local SQLite file, shared by worker processes on one machine.
+
+    A leased item is invisible to other workers until it is completed, released or its visibility
+    timeout passes. Statements wait up to 30 seconds for other processes' locks, so they run in a thread
+    to keep the event loop going.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS work_items ('
+                        'key TEXT PRIMARY KEY, payload TEXT NOT NULL, priority INTEGER NOT NULL, '
+                        'leased_until REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, '
+                        'done INTEGER NOT NULL DEFAULT 0)')
+        self._lock = asyncio.Lock()
+
+    async def _run(self, function, *args):
+        async with self._lock:  # One connection, so one statement or transaction at a time
+            return await asyncio.to_thread(function, *args)
+
+    async def add(self, items, forefront=False):
+        """Add `(key, payload)` pairs, keys already in the queue are ignored."""
+        rows = [(key, json.dumps(payload, default=str), 0 if forefront else 1) for key, payload in items]
+        await self._run(self.db.executemany,
+                        'INSERT OR IGNORE INTO work_items (key, payload, priority) VALUES (?, ?, ?)', rows)
+
+    def _lease(self, limit, visibility_timeout):
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.db.execute('SELECT key, payload, attempts FROM work_items '
+                                   'WHERE done = 0 AND leased_until < ? ORDER BY priority, rowid LIMIT ?',
+                                   (now, limit)).fetchall()
+            self.db.executemany('UPDATE work_items SET leased_until = ?, attempts = attempts + 1 WHERE key = ?',
+                                [(now + visibility_timeout, key) for key, _, _ in rows])
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return rows
+
+    async def lease(self, limit=1, visibility_timeout=300):
+        rows = await self._run(self._lease, limit, visibility_timeout)
+        return [WorkItem(key, json.loads(payload), attempts + 1) for key, payload, attempts in rows]
+
+    async def complete(self, items):
+        await self._run(self.db.executemany, 'UPDATE work_items SET done = 1 WHERE key = ?',
+                        [(item.key,) for item in items])
+
+    async def release(self, item):
+        await self._run(self.db.execute, 'UPDATE work_items SET leased_until = 0 WHERE key = ?', (item.key,))
+
+    def _counts(self):
+        return self.db.execute('SELECT COUNT(*), COALESCE(SUM(done), 0) FROM work_items').fetchone()
+
+    async def is_finished(self):
+        total, done = await self._run(self._counts)
+        return total > 0 and total == done
+
+    def close(self):
+        self.db.close()
+
+
+class ApifyWorkQueue:
+    """Work queue on a named Apify request queue, shared by any number of actor runs.
+
+    Items are leased with the queue head locks of the API, so each run needs its own client key. An item's
+    `retryCount` counts its leases, so items of runs that died while holding them count towards the attempts too.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    async def open(cls, name):
+        queue = await Actor.apify_client.request_queues().get_or_create(name=name)
+        return cls(Actor.apify_client.request_queue(queue['id'], client_key=uuid.uuid4().hex))
+
+    async def add(self, items, forefront=False, max_retries=5):
+        """Add `(key, payload)` pairs, requests the API leaves unprocessed, e.g. when throttled, are retried."""
+        requests = [{'url': payload.get('url') or f"https://asunnot.oikotie.fi/#{key}", 'uniqueKey': key,
+                     'userData': json.loads(json.dumps(payload, default=str))} for key, payload in items]
+        for start in range(0, len(requests), 25):  # The batch endpoint takes at most 25 requests
+            batch = requests[start:start + 25]
+            for attempt in range(max_retries):
+                if attempt:
+                    await asyncio.sleep(backoff_delay(attempt - 1))
+                result = await self.client.batch_add_requests(batch, forefront=forefront)
+                unprocessed = {request['uniqueKey'] for request in result.get('unprocessedRequests') or []}
+                batch = [request for request in batch if request['uniqueKey'] in unprocessed]
+                if not batch:
+                    break
+            else:
+                raise RuntimeError(f"Failed to add {len(batch)} work items after {max_retries} attempts, "
+                                   f"e.g. {batch[0]['uniqueKey']}")
+
+    async def _lease_request(self, request_id):
+        request = await self.client.get_request(request_id)
+        if not request or request.get('handledAt'):
+            return None
+        request = {**request, 'retryCount': request.get('retryCount', 0) + 1}
+        await self.client.update_request(request)
+        return WorkItem(request['uniqueKey'], request.get('userData') or {}, request['retryCount'], request)
+
+    async def lease(self, limit=1, visibility_timeout=300):
+        head = await self.client.list_and_lock_head(lock_secs=int(visibility_timeout), limit=limit)
+        items = await asyncio.gather(*[self._lease_request(item['id']) for item in head.get('items', [])])
+        return [item for item in items if item]
+
+    async def complete(self, items):
+        handled_at = datetime.now(timezone.utc).isoformat()
+        await asyncio.gather(*[self.client.update_request({**item.handle, 'handledAt': handled_at})
+                               for item in items])
+
+    async def release(self, item):
+        await self.client.delete_request_lock(item.handle['id'])
+
+    async def is_finished(self):
+        info = await self.client.get() or {}
+        return info.get('totalRequestCount', 0) > 0 and info.get('pendingRequestCount', 1) == 0
+
+    def close(self):
+        pass
+
+
+async def open_work_queue(backend='apify', name='oikotie-work', path=None):
+    if backend == 'sqlite':
+        return SqliteWorkQueue(path or f'{name}.sqlite3')
+    return await ApifyWorkQueue.open(name)